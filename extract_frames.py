@@ -1,14 +1,122 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import subprocess
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
 import cv2
 from PIL import Image
 import numpy as np
 from tqdm import tqdm
 
+@lru_cache(maxsize=None)
+def check_ffmpeg():
+    """Verifica si FFmpeg está instalado en el sistema (se consulta una vez)"""
+    try:
+        result = subprocess.run(['ffmpeg', '-version'],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               text=True)
+        return result.returncode == 0
+    except FileNotFoundError:
+        return False
+
+def open_decoder(video_path, frame_interval=1):
+    """
+    Lanza FFmpeg para decodificar el video a frames BGR crudos por stdout
+    
+    Usa el decodificador por hardware si FFmpeg encuentra uno disponible. Con
+    frame_interval > 1 solo se entrega uno de cada frame_interval frames: el
+    filtro select los descarta antes de convertirlos a BGR y enviarlos por el pipe.
+    
+    Returns:
+        El proceso de FFmpeg (leer los frames de proc.stdout con read_frames_into).
+        Sus errores quedan en proc.error_log (ver decoder_error)
+    """
+    cmd = [
+        'ffmpeg', '-loglevel', 'error',
+        '-hwaccel', 'auto',
+        '-i', video_path,
+        '-map', '0:v:0',
+    ]
+    if frame_interval > 1:
+        cmd += ['-vf', f"select='not(mod(n,{frame_interval}))'", '-vsync', 'vfr']
+    else:
+        cmd += ['-vsync', '0']
+    cmd += [
+        '-f', 'rawvideo',
+        '-pix_fmt', 'bgr24',
+        'pipe:1'
+    ]
+    # Los errores van a un archivo temporal y no a una tubería: si FFmpeg escribe
+    # muchos y nadie los lee, la tubería se llenaría y bloquearía la decodificación
+    error_log = tempfile.TemporaryFile()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=error_log, bufsize=10**8)
+    proc.error_log = error_log
+    return proc
+
+def decoder_error(proc):
+    """Espera al decodificador y devuelve sus errores si terminó con fallo (None si no)"""
+    returncode = proc.wait()
+    with proc.error_log as error_log:
+        if returncode == 0:
+            return None
+        error_log.seek(0)
+        message = error_log.read().decode(errors='replace').strip()
+    return message or f"código de salida {returncode}"
+
+def read_frames_into(proc, buffers):
+    """
+    Lee los frames del decodificador sobre buffers preasignados, usados en rotación
+    
+    Cada buffer se vuelve a llenar len(buffers) frames después: el llamador debe
+    terminar de usarlo antes de pedir ese frame.
+    """
+    views = [memoryview(buf).cast('B') for buf in buffers]
+    frame_size = len(views[0])
+    index = 0
+    while True:
+        view = views[index]
+        filled = 0
+        while filled < frame_size:
+            n = proc.stdout.readinto(view[filled:])
+            if not n:
+                return
+            filled += n
+        yield buffers[index]
+        index = (index + 1) % len(buffers)
+
+def capture_frames(cap, frame_interval=1):
+    """
+    Genera uno de cada frame_interval frames de un cv2.VideoCapture
+    
+    Los frames descartados solo se avanzan con grab(), sin convertirlos a BGR.
+    """
+    frame_count = 0
+    while True:
+        if frame_count % frame_interval == 0:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+        elif not cap.grab():
+            break
+        frame_count += 1
+
+def save_frame(frame, frame_path, output_format='webp', quality=80):
+    """Guarda un frame BGR con OpenCV (directamente, sin convertirlo a RGB ni pasarlo por PIL)"""
+    if output_format == 'webp':
+        params = [int(cv2.IMWRITE_WEBP_QUALITY), quality]
+    else:  # png
+        params = [int(cv2.IMWRITE_PNG_COMPRESSION), 6]
+    if not cv2.imwrite(frame_path, frame, params):
+        raise IOError(f"No se pudo guardar el frame: {frame_path}")
+
 def extract_frames_from_video(video_path, output_dir, fps=None, preserve_alpha=True, 
-                             output_format='webp', quality=80):
+                             output_format='webp', quality=80, workers=None):
     """
     Extrae frames de un archivo de video
     
@@ -19,6 +127,7 @@ def extract_frames_from_video(video_path, output_dir, fps=None, preserve_alpha=T
         preserve_alpha: Intentar preservar canal alpha si existe
         output_format: Formato de salida ('png' o 'webp')
         quality: Calidad de compresión (1-100, solo para webp)
+        workers: Hilos que codifican los frames en paralelo (None = todos los núcleos)
     """
     # Crear directorio de salida
     os.makedirs(output_dir, exist_ok=True)
@@ -31,6 +140,8 @@ def extract_frames_from_video(video_path, output_dir, fps=None, preserve_alpha=T
     # Obtener información del video
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     video_fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     
     print(f"Video: {os.path.basename(video_path)}")
     print(f"FPS original: {video_fps}")
@@ -42,40 +153,72 @@ def extract_frames_from_video(video_path, output_dir, fps=None, preserve_alpha=T
         frame_interval = int(video_fps / fps)
         print(f"Extrayendo a {fps} FPS (cada {frame_interval} frames)")
     
-    frame_count = 0
+    # La decodificación sigue en el hilo principal y los frames se codifican en un
+    # pool de hilos (cv2.imwrite libera el GIL); se limita el número de frames en
+    # cola para acotar la memoria
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = 2 * workers
+    pending = deque()
+    
+    # Con FFmpeg los frames se decodifican en un proceso aparte y se leen sobre
+    # un anillo de buffers reservados una sola vez, uno por frame en cola; sin
+    # FFmpeg se usa OpenCV. En ambos casos solo llegan aquí los frames que se
+    # van a guardar
+    proc = None
+    if check_ffmpeg():
+        cap.release()
+        proc = open_decoder(video_path, frame_interval)
+        frame_ring = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(max_in_flight)]
+        frames = read_frames_into(proc, frame_ring)
+    else:
+        frames = capture_frames(cap, frame_interval)
+    
     saved_count = 0
+    finished = False
+    decode_error = None
     
     # Iterar sobre todos los frames
-    with tqdm(total=total_frames, desc="Extrayendo frames") as pbar:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            if frame_count % frame_interval == 0:
-                # Convertir de BGR a RGB
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
+    try:
+        with tqdm(total=-(-total_frames // frame_interval), desc="Extrayendo frames") as pbar, \
+             ThreadPoolExecutor(max_workers=workers) as executor:
+            for frame in frames:
                 # Guardar el frame
                 frame_filename = f"frame_{saved_count:04d}.{output_format}"
                 frame_path = os.path.join(output_dir, frame_filename)
                 
-                # Guardar con el formato especificado
-                if output_format == 'webp':
-                    Image.fromarray(frame_rgb).save(frame_path, 'WEBP', quality=quality, lossless=False)
-                else:  # png
-                    Image.fromarray(frame_rgb).save(frame_path, 'PNG', optimize=True)
+                pending.append(executor.submit(save_frame, frame, frame_path,
+                                               output_format, quality))
+                
+                # Esperar al frame más antiguo antes de leer el siguiente: así su
+                # buffer del anillo ya está libre cuando el decodificador lo reutiliza
+                if len(pending) >= max_in_flight:
+                    pending.popleft().result()
                 saved_count += 1
+                pbar.update(1)
             
-            frame_count += 1
-            pbar.update(1)
+            # Esperar a que se guarden los últimos frames
+            while pending:
+                pending.popleft().result()
+        finished = True
+    finally:
+        if proc:
+            proc.stdout.close()
+            # Si se sale antes del final se detiene FFmpeg (su error no interesa)
+            if not finished:
+                proc.terminate()
+            decode_error = decoder_error(proc)
+        cap.release()
     
-    cap.release()
+    # Un fallo a mitad del video deja un conjunto de frames incompleto
+    if proc and decode_error:
+        raise RuntimeError(f"FFmpeg no pudo decodificar el video {video_path}: {decode_error}")
+    if proc and saved_count == 0:
+        raise RuntimeError(f"FFmpeg no pudo decodificar el video: {video_path}")
     print(f"Extraídos {saved_count} frames")
     return saved_count
 
 def extract_frames_from_gif(gif_path, output_dir, preserve_alpha=True, 
-                           output_format='webp', quality=80):
+                           output_format='webp', quality=80, animated=False):
     """
     Extrae frames de un archivo GIF preservando transparencia
     
@@ -85,6 +228,8 @@ def extract_frames_from_gif(gif_path, output_dir, preserve_alpha=True,
         preserve_alpha: Preservar transparencia
         output_format: Formato de salida ('png' o 'webp')
         quality: Calidad de compresión (1-100, solo para webp)
+        animated: Guardar un único WebP animado en lugar de un archivo por frame
+            (mucho más pequeño: libwebp codifica solo lo que cambia entre frames)
     """
     # Crear directorio de salida
     os.makedirs(output_dir, exist_ok=True)
@@ -104,75 +249,88 @@ def extract_frames_from_gif(gif_path, output_dir, preserve_alpha=True,
     # Obtener el tamaño del GIF
     width, height = gif.size
     
-    # Crear un canvas base para componer los frames
-    # Esto es necesario porque los GIFs pueden usar optimización de frames
-    base_canvas = None
+    # Canvas base y frame compuesto como arrays RGBA que se reutilizan en todos los
+    # frames. Es necesario porque los GIFs pueden usar optimización de frames
+    base_canvas = np.zeros((height, width, 4), dtype=np.uint8)
+    current_frame = np.empty_like(base_canvas)
+    blend = np.empty((height, width, 4), dtype=np.uint16)
+    work = np.empty_like(blend)
+    output = np.empty((height, width, 4 if preserve_alpha else 3), dtype=np.uint8)
+    
+    # Frames y duraciones para el WebP animado
+    animation_frames = []
+    durations = []
     
     # Extraer frames
     for i in tqdm(range(n_frames), desc="Extrayendo frames"):
         gif.seek(i)
         
-        # Convertir el frame actual
-        frame = gif.convert('RGBA')
+        # Convertir el frame actual (PIL ya lo devuelve con el tamaño completo del GIF)
+        frame = np.asarray(gif.convert('RGBA'))
         
         # Si es el primer frame o si el GIF usa disposal method 2 (restore to background)
-        # necesitamos crear un nuevo canvas
+        # necesitamos limpiar el canvas
         disposal_method = gif.disposal_method if hasattr(gif, 'disposal_method') else 0
         
         if i == 0 or disposal_method == 2:
-            # Crear nuevo canvas transparente
-            base_canvas = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+            # Canvas transparente
+            base_canvas.fill(0)
         
         # Si el GIF usa disposal method 1 (do not dispose), 
         # mantenemos el canvas anterior
         
-        # Obtener la posición del frame actual (algunos GIFs tienen frames que no cubren todo el canvas)
-        if hasattr(gif, 'tile') and len(gif.tile) > 0:
-            # Obtener las coordenadas del frame
-            tile = gif.tile[0]
-            if len(tile) > 2 and isinstance(tile[1], tuple) and len(tile[1]) == 4:
-                left, top, right, bottom = tile[1]
-                position = (left, top)
-            else:
-                position = (0, 0)
-        else:
-            position = (0, 0)
-        
         # Componer el frame actual sobre el canvas base
-        if base_canvas:
-            # Crear una copia del canvas para este frame
-            current_frame = base_canvas.copy()
-            
-            # Pegar el frame actual en la posición correcta
-            current_frame.paste(frame, position, frame if preserve_alpha else None)
-            
-            # Actualizar el canvas base para el próximo frame si es necesario
-            if disposal_method == 1:  # Do not dispose
-                base_canvas = current_frame.copy()
-            
-            frame_to_save = current_frame
+        if preserve_alpha:
+            # Mezcla con el alpha del frame, con el mismo redondeo que Image.paste:
+            # (canvas * (255 - alpha) + frame * alpha) / 255
+            alpha = frame[..., 3:4]
+            np.subtract(255, alpha, out=blend, dtype=np.uint16)
+            np.multiply(blend, base_canvas, out=blend)
+            np.multiply(frame, alpha, out=work, dtype=np.uint16)
+            np.add(blend, work, out=blend)
+            np.add(blend, 128, out=blend)
+            np.right_shift(blend, 8, out=work)
+            np.add(blend, work, out=blend)
+            np.right_shift(blend, 8, out=blend)
+            np.copyto(current_frame, blend, casting='unsafe')
         else:
-            frame_to_save = frame
+            np.copyto(current_frame, frame)
+        
+        frame_to_save = current_frame
+        
+        # Actualizar el canvas base para el próximo frame si es necesario
+        # (intercambiando los buffers, sin copiar)
+        if disposal_method == 1:  # Do not dispose
+            base_canvas, current_frame = current_frame, base_canvas
+        
+        if animated:
+            # Copiar el frame: los buffers se reutilizan en el siguiente
+            if preserve_alpha:
+                animation_frames.append(Image.fromarray(frame_to_save.copy(), 'RGBA'))
+            else:
+                animation_frames.append(Image.fromarray(frame_to_save[..., :3].copy(), 'RGB'))
+            durations.append(gif.info.get('duration', 100))
+            continue
         
         # Guardar el frame
         frame_filename = f"frame_{i:04d}.{output_format}"
         frame_path = os.path.join(output_dir, frame_filename)
         
-        # Guardar con el formato especificado
-        if output_format == 'webp':
-            if preserve_alpha and frame_to_save.mode == 'RGBA':
-                frame_to_save.save(frame_path, 'WEBP', quality=quality, lossless=False, exact=True)
-            else:
-                # Convertir a RGB si no queremos transparencia
-                frame_to_save = frame_to_save.convert('RGB')
-                frame_to_save.save(frame_path, 'WEBP', quality=quality, lossless=False)
-        else:  # png
-            if preserve_alpha and frame_to_save.mode == 'RGBA':
-                frame_to_save.save(frame_path, 'PNG', optimize=True)
-            else:
-                # Convertir a RGB si no queremos transparencia
-                frame_to_save = frame_to_save.convert('RGB')
-                frame_to_save.save(frame_path, 'PNG', optimize=True)
+        # Guardar con el formato especificado (OpenCV espera BGR/BGRA)
+        if preserve_alpha:
+            cv2.cvtColor(frame_to_save, cv2.COLOR_RGBA2BGRA, dst=output)
+        else:
+            # Descartar el canal alpha si no queremos transparencia
+            cv2.cvtColor(frame_to_save, cv2.COLOR_RGBA2BGR, dst=output)
+        save_frame(output, frame_path, output_format, quality)
+    
+    if animated:
+        animation_path = os.path.join(output_dir, f"{Path(gif_path).stem}.webp")
+        animation_frames[0].save(animation_path, 'WEBP', save_all=True,
+                                 append_images=animation_frames[1:], duration=durations,
+                                 loop=gif.info.get('loop', 0), quality=quality,
+                                 method=6, minimize_size=True)
+        print(f"WebP animado: {animation_path}")
     
     print(f"Extraídos {n_frames} frames")
     return n_frames
@@ -187,6 +345,10 @@ def main():
                         help='Formato de salida (default: webp)')
     parser.add_argument('--quality', type=int, default=80, 
                         help='Calidad de compresión para WebP (1-100, default: 80)')
+    parser.add_argument('--animated', action='store_true',
+                        help='Guardar los frames del GIF como un único WebP animado')
+    parser.add_argument('--workers', type=int,
+                        help='Hilos que guardan los frames de video en paralelo (default: todos los núcleos)')
     
     args = parser.parse_args()
     
@@ -203,13 +365,18 @@ def main():
         print("Error: La calidad debe estar entre 1 y 100")
         return
     
+    # El WebP animado solo está disponible para GIFs y en formato webp
+    if args.animated and (ext != '.gif' or args.format != 'webp'):
+        print("Error: --animated solo se puede usar con GIFs y --format webp")
+        return
+    
     try:
         if ext == '.gif':
             extract_frames_from_gif(args.input, args.output_dir, not args.no_alpha, 
-                                   args.format, args.quality)
+                                   args.format, args.quality, args.animated)
         elif ext in ['.mp4', '.avi', '.mov', '.webm', '.mkv']:
             extract_frames_from_video(args.input, args.output_dir, args.fps, not args.no_alpha,
-                                     args.format, args.quality)
+                                     args.format, args.quality, args.workers)
         else:
             print(f"Formato no soportado: {ext}")
             print("Formatos soportados: .gif, .mp4, .avi, .mov, .webm, .mkv")
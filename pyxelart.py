@@ -3,9 +3,36 @@ import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 import argparse
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+from functools import lru_cache, partial
 from pathlib import Path
 from tqdm import tqdm
 
+try:
+    import pyvips
+except ImportError:
+    pyvips = None
+
+@lru_cache(maxsize=32)
+def get_font(size):
+    """Carga (una sola vez por tamaño) la fuente para el cuadro de diálogo"""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except:
+        return ImageFont.load_default()
+
+def ratio_matches(width, height, target_ratio):
+    """
+    Indica si unas dimensiones ya tienen la relación de aspecto objetivo
+    
+    Compara de forma exacta con enteros (width/height reducido como fracción), sin
+    errores de redondeo. Si la relación objetivo llega como float se convierte antes
+    a la fracción más cercana (p. ej. 4/3 -> Fraction(4, 3)).
+    """
+    return Fraction(width, height) == Fraction(target_ratio).limit_denominator(10000)
+
 def apply_aspect_ratio(img, target_ratio, method='resize'):
     """
     Aplica una relación de aspecto específica a la imagen
@@ -21,7 +48,7 @@ def apply_aspect_ratio(img, target_ratio, method='resize'):
     width, height = img.size
     current_ratio = width / height
     
-    if abs(current_ratio - target_ratio) < 0.01:
+    if ratio_matches(width, height, target_ratio):
         # Ya tiene la relación de aspecto correcta
         return img
     
@@ -47,11 +74,11 @@ def apply_aspect_ratio(img, target_ratio, method='resize'):
     return img
 
 def parse_aspect_ratio(aspect_str):
-    """Convierte una cadena de relación de aspecto a un valor numérico"""
+    """Convierte una cadena de relación de aspecto a una fracción exacta"""
     if aspect_str == "4:3":
-        return 4/3
+        return Fraction(4, 3)
     elif aspect_str == "1:1":
-        return 1.0
+        return Fraction(1)
     elif aspect_str == "original":
         return None
     else:
@@ -59,15 +86,133 @@ def parse_aspect_ratio(aspect_str):
             # Intentar interpretar como "x:y"
             parts = aspect_str.split(":")
             if len(parts) == 2:
-                return float(parts[0]) / float(parts[1])
+                return Fraction(parts[0]) / Fraction(parts[1])
         except:
             pass
         
         raise ValueError(f"Formato de relación de aspecto no reconocido: {aspect_str}")
 
+def _fixed_palette_masks(color_depth):
+    """Calcula las máscaras y desplazamientos por canal (R, G, B) de la paleta fija"""
+    bits = min(8, max(3, int(np.log2(max(color_depth, 2)))))
+    channel_bits = [bits // 3] * 3
+    for channel in (1, 0)[:bits % 3]:
+        channel_bits[channel] += 1
+    
+    masks = [(0xFF << (8 - b)) & 0xFF for b in channel_bits]
+    # Centrar cada nivel en su intervalo para no oscurecer la imagen
+    offsets = [1 << (7 - b) for b in channel_bits]
+    return masks, offsets
+
+def _quantize_fixed(arr, color_depth):
+    """
+    Reduce colores con una paleta RGB fija aplicando máscaras de bits
+    
+    Los bits disponibles (log2 de color_depth) se reparten entre los canales,
+    dando prioridad al verde y luego al rojo (1-2-1 para 16, 2-2-2 para 64,
+    3-3-2 para 256). No calcula ninguna paleta: es una sola pasada sobre el array.
+    
+    Args:
+        arr: Array numpy RGB (uint8), se modifica en el sitio
+        color_depth: Número de colores aproximado
+        
+    Returns:
+        El array con los colores reducidos
+    """
+    masks, offsets = _fixed_palette_masks(color_depth)
+    
+    np.bitwise_and(arr, np.array(masks, dtype=np.uint8), out=arr)
+    np.bitwise_or(arr, np.array(offsets, dtype=np.uint8), out=arr)
+    return arr
+
+def reduce_colors(img, color_depth, palette='adaptive'):
+    """
+    Reduce la cantidad de colores de una imagen RGB
+    
+    Args:
+        img: La imagen PIL en modo RGB
+        color_depth: Número de colores
+        palette: 'adaptive' para calcular la paleta de la imagen, 'fixed' para paleta RGB fija
+        
+    Returns:
+        La imagen PIL en modo RGB con los colores reducidos
+    """
+    if palette == 'fixed':
+        return Image.fromarray(_quantize_fixed(np.array(img), color_depth))
+    
+    img = img.quantize(colors=color_depth, method=Image.Quantize.FASTOCTREE,
+                       dither=Image.Dither.NONE)
+    return img.convert('RGB')
+
+def _retro_pixels_vips(input_path, width=None, height=None, color_depth=16, pixel_size=4,
+                       aspect_ratio=None, aspect_method='resize'):
+    """
+    Aplica relación de aspecto, redimensionado, paleta, pixelado y ruido con libvips
+    
+    libvips evalúa toda la cadena bajo demanda, por franjas de la imagen, en lugar de
+    materializar una imagen completa entre cada paso. La reducción de colores usa
+    siempre la paleta RGB fija (libvips no calcula paletas adaptativas).
+    
+    Returns:
+        Tupla (imagen PIL resultante, tiene_alpha)
+    """
+    if pyvips is None:
+        raise ImportError("El backend 'vips' requiere pyvips (pip install pyvips)")
+    
+    img = pyvips.Image.new_from_file(input_path, access='sequential')
+    if img.interpretation != 'srgb':
+        img = img.colourspace('srgb')
+    has_alpha = img.hasalpha()
+    
+    # Aplicar relación de aspecto si se especifica
+    if aspect_ratio is not None and not ratio_matches(img.width, img.height, aspect_ratio):
+        if aspect_method == 'resize':
+            new_width = int(img.height * aspect_ratio)
+            img = img.resize(new_width / img.width, vscale=1, kernel='lanczos3')
+        elif aspect_method == 'crop':
+            if img.width / img.height > aspect_ratio:
+                new_w = int(img.height * aspect_ratio)
+                img = img.crop((img.width - new_w) // 2, 0, new_w, img.height)
+            else:
+                new_h = int(img.width / aspect_ratio)
+                img = img.crop(0, (img.height - new_h) // 2, img.width, new_h)
+    
+    # Redimensionar si se especifica
+    if width and height:
+        img = img.resize(width / img.width, vscale=height / img.height, kernel='lanczos3')
+    
+    img = img.cast('uchar')
+    
+    # Pixelado de RGB y alpha. reduce con kernel 'nearest' toma los mismos píxeles
+    # que Image.NEAREST del backend PIL (el centro de cada bloque, repartiendo el
+    # sobrante si el tamaño no es múltiplo de pixel_size)
+    pixel_width = img.width // pixel_size
+    pixel_height = img.height // pixel_size
+    img = img.reduce(img.width / pixel_width, img.height / pixel_height, kernel='nearest')
+    img = img.zoom(pixel_size, pixel_size)
+    
+    # Reducir colores con la paleta fija
+    rgb = img.extract_band(0, n=3)
+    masks, offsets = _fixed_palette_masks(color_depth)
+    rgb = (rgb & masks) | offsets
+    
+    # Ruido solo sobre los canales RGB (cast a uchar satura en 0-255)
+    noise = pyvips.Image.gaussnoise(rgb.width, rgb.height, mean=7, sigma=4)
+    rgb = (rgb + noise).cast('uchar')
+    
+    if has_alpha:
+        img = rgb.bandjoin(img.extract_band(3))
+    else:
+        img = rgb
+    
+    mode = 'RGBA' if has_alpha else 'RGB'
+    final_img = Image.frombytes(mode, (img.width, img.height), img.write_to_memory())
+    return final_img, has_alpha
+
 def retro_effect(input_path, output_path=None, width=None, height=None, color_depth=16, 
                  pixel_size=4, add_dialog=False, dialog_text="", 
-                 aspect_ratio=None, aspect_method='resize', quality=95, output_format=None):
+                 aspect_ratio=None, aspect_method='resize', quality=95, output_format=None,
+                 palette='adaptive', backend='pil'):
     """
     Aplica un efecto retro a una imagen individual
     
@@ -84,67 +229,102 @@ def retro_effect(input_path, output_path=None, width=None, height=None, color_de
         aspect_method: Método para ajustar relación de aspecto ('resize' o 'crop')
         quality: Calidad de la imagen para formatos con compresión (1-100, por defecto: 95)
         output_format: Formato de salida ('png', 'jpg', 'webp', o None para usar original)
+        palette: Tipo de paleta ('adaptive' o 'fixed', por defecto: 'adaptive')
+        backend: Motor de procesamiento ('pil' o 'vips', por defecto: 'pil')
     """
-    # Cargar imagen
-    img = Image.open(input_path)
-    
-    # Detectar si la imagen tiene canal alfa (transparencia)
-    has_alpha = img.mode == 'RGBA' or 'A' in img.getbands()
-    
-    # Aplicar relación de aspecto si se especifica
-    if aspect_ratio is not None:
-        img = apply_aspect_ratio(img, aspect_ratio, aspect_method)
+    # Configuración de salida por defecto si no se especifica
+    if not output_path:
+        filename, ext = os.path.splitext(input_path)
+        # Usar formato especificado o mantener el original
+        if output_format:
+            ext = f".{output_format}"
+        output_path = f"{filename}_retro-c{color_depth}-p{pixel_size}{ext}"
+    else:
+        # Si se especifica output_path y output_format, asegurar la extensión correcta
+        if output_format:
+            output_path = str(Path(output_path).with_suffix(f".{output_format}"))
     
-    # Redimensionar si se especifica
-    if width and height:
-        img = img.resize((width, height), Image.LANCZOS)
+    # Si la configuración no modifica la imagen (sin pixelado, paleta completa, sin
+    # diálogo, sin redimensionar y mismo formato) copiar el archivo sin procesarlo
+    same_format = Path(output_path).suffix.lower() == Path(input_path).suffix.lower()
+    if (pixel_size == 1 and color_depth >= 256 and not add_dialog
+            and aspect_ratio is None and width is None and height is None and same_format):
+        # Si la salida es el propio archivo de entrada no hay nada que copiar
+        if os.path.exists(output_path) and os.path.samefile(input_path, output_path):
+            print(f"Imagen sin cambios: {output_path}")
+        else:
+            shutil.copyfile(input_path, output_path)
+            print(f"Imagen copiada sin cambios en: {output_path}")
+        # Cargar los píxeles y cerrar el archivo (Image.open lo dejaría abierto)
+        with Image.open(output_path) as img:
+            img.load()
+        return img
     
-    # Aplicar reducción de colores preservando canal alfa si existe
-    if has_alpha:
-        # Separar canales RGB y Alpha
-        rgb = img.convert('RGB')
-        alpha = img.split()[-1]
-        
-        # Reducir colores en RGB
-        rgb = rgb.convert('P', palette=Image.ADAPTIVE, colors=color_depth)
-        rgb = rgb.convert('RGB')
-        
-        # Pixelado a RGB
-        pixel_width = rgb.width // pixel_size
-        pixel_height = rgb.height // pixel_size
-        rgb = rgb.resize((pixel_width, pixel_height), Image.NEAREST)
-        rgb = rgb.resize((rgb.width * pixel_size, rgb.height * pixel_size), Image.NEAREST)
-        
-        # Pixelado al canal alpha
-        alpha = alpha.resize((pixel_width, pixel_height), Image.NEAREST)
-        alpha = alpha.resize((rgb.width, rgb.height), Image.NEAREST)
-        
-        # Aplicar ruido solo a canales RGB
-        np_rgb = np.array(rgb)
-        noise = np.random.randint(0, 15, np_rgb.shape)
-        np_rgb = np.clip(np_rgb + noise, 0, 255).astype(np.uint8)
-        rgb_with_noise = Image.fromarray(np_rgb)
-        
-        # Recombinar RGB y Alpha
-        final_img = rgb_with_noise.convert('RGBA')
-        final_img.putalpha(alpha)
+    if backend == 'vips':
+        # Pipeline completo en libvips (streaming por bloques)
+        final_img, has_alpha = _retro_pixels_vips(
+            input_path, width, height, color_depth, pixel_size,
+            aspect_ratio, aspect_method
+        )
     else:
-        # Aplicar reducción de colores
-        img = img.convert('P', palette=Image.ADAPTIVE, colors=color_depth)
-        img = img.convert('RGB')
+        # Cargar imagen
+        img = Image.open(input_path)
+        
+        # Detectar si la imagen tiene canal alfa (transparencia)
+        has_alpha = img.mode == 'RGBA' or 'A' in img.getbands()
         
-        # Pixelado
-        pixel_width = img.width // pixel_size
-        pixel_height = img.height // pixel_size
-        img = img.resize((pixel_width, pixel_height), Image.NEAREST)
-        img = img.resize((img.width * pixel_size, img.height * pixel_size), Image.NEAREST)
+        # Aplicar relación de aspecto si se especifica
+        if aspect_ratio is not None:
+            img = apply_aspect_ratio(img, aspect_ratio, aspect_method)
         
-        # Aplicar ruido/dithering para estética retro
-        np_img = np.array(img)
-        noise = np.random.randint(0, 15, np_img.shape)
-        np_img = np.clip(np_img + noise, 0, 255).astype(np.uint8)
+        # Redimensionar si se especifica
+        if width and height:
+            img = img.resize((width, height), Image.LANCZOS)
         
-        final_img = Image.fromarray(np_img)
+        # Aplicar reducción de colores preservando canal alfa si existe
+        if has_alpha:
+            # Separar canales RGB y Alpha
+            rgb = img.convert('RGB')
+            alpha = img.split()[-1]
+            
+            # Reducir colores en RGB
+            rgb = reduce_colors(rgb, color_depth, palette)
+            
+            # Pixelado a RGB
+            pixel_width = rgb.width // pixel_size
+            pixel_height = rgb.height // pixel_size
+            rgb = rgb.resize((pixel_width, pixel_height), Image.NEAREST)
+            rgb = rgb.resize((rgb.width * pixel_size, rgb.height * pixel_size), Image.NEAREST)
+            
+            # Pixelado al canal alpha
+            alpha = alpha.resize((pixel_width, pixel_height), Image.NEAREST)
+            alpha = alpha.resize((rgb.width, rgb.height), Image.NEAREST)
+            
+            # Aplicar ruido solo a canales RGB
+            np_rgb = np.array(rgb)
+            noise = np.random.randint(0, 15, np_rgb.shape)
+            np_rgb = np.clip(np_rgb + noise, 0, 255).astype(np.uint8)
+            rgb_with_noise = Image.fromarray(np_rgb)
+            
+            # Recombinar RGB y Alpha
+            final_img = rgb_with_noise.convert('RGBA')
+            final_img.putalpha(alpha)
+        else:
+            # Aplicar reducción de colores
+            img = reduce_colors(img.convert('RGB'), color_depth, palette)
+            
+            # Pixelado
+            pixel_width = img.width // pixel_size
+            pixel_height = img.height // pixel_size
+            img = img.resize((pixel_width, pixel_height), Image.NEAREST)
+            img = img.resize((img.width * pixel_size, img.height * pixel_size), Image.NEAREST)
+            
+            # Aplicar ruido/dithering para estética retro
+            np_img = np.array(img)
+            noise = np.random.randint(0, 15, np_img.shape)
+            np_img = np.clip(np_img + noise, 0, 255).astype(np.uint8)
+            
+            final_img = Image.fromarray(np_img)
     
     # Opcional: añadir cuadro de diálogo estilo retro
     if add_dialog and dialog_text:
@@ -162,28 +342,12 @@ def retro_effect(input_path, output_path=None, width=None, height=None, color_de
         dialog_box = (10, final_img.height + 5, final_img.width - 10, final_img.height + dialog_height - 5)
         draw.rectangle(dialog_box, fill=(80, 80, 80), outline=(200, 200, 200))
         
-        try:
-            font = ImageFont.truetype("arial.ttf", pixel_size * 3)
-        except:
-            font = ImageFont.load_default()
-            
+        font = get_font(pixel_size * 3)
         text_pos = (dialog_box[0] + 10, dialog_box[1] + 10)
         draw.text(text_pos, dialog_text, fill=(0, 0, 200), font=font)
         
         final_img = canvas
     
-    # Configuración de salida por defecto si no se especifica
-    if not output_path:
-        filename, ext = os.path.splitext(input_path)
-        # Usar formato especificado o mantener el original
-        if output_format:
-            ext = f".{output_format}"
-        output_path = f"{filename}_retro-c{color_depth}-p{pixel_size}{ext}"
-    else:
-        # Si se especifica output_path y output_format, asegurar la extensión correcta
-        if output_format:
-            output_path = str(Path(output_path).with_suffix(f".{output_format}"))
-    
     # Determinar opciones de guardado según el formato
     save_options = {}
     lower_path = output_path.lower()
@@ -215,17 +379,30 @@ def retro_effect(input_path, output_path=None, width=None, height=None, color_de
     print(f"Imagen procesada guardada en: {output_path}")
     return final_img
 
+def _retro_effect_worker(input_path, output_path, **options):
+    """Aplica retro_effect en un proceso worker y devuelve solo la ruta de salida"""
+    retro_effect(input_path, output_path, **options)
+    return output_path
+
 def process_image_directory(input_dir, output_dir=None, width=None, height=None, 
                            color_depth=16, pixel_size=4, add_dialog=False, dialog_text="",
-                           aspect_ratio=None, aspect_method='resize', quality=95, output_format=None):
+                           aspect_ratio=None, aspect_method='resize', quality=95, output_format=None,
+                           palette='adaptive', workers=None, backend='pil'):
     """
     Procesa todas las imágenes en un directorio
+    
+    Las imágenes se procesan en paralelo con un pool de procesos
+    (workers=None usa todos los núcleos disponibles).
     """
     # Asegurar que el directorio existe
     input_path = Path(input_dir)
     if not input_path.exists() or not input_path.is_dir():
         raise ValueError(f"El directorio {input_dir} no existe")
     
+    # Resolver la relación de aspecto una sola vez para todo el lote
+    if isinstance(aspect_ratio, str):
+        aspect_ratio = parse_aspect_ratio(aspect_ratio)
+    
     # Crear directorio de salida
     if output_dir:
         output_path = Path(output_dir)
@@ -247,8 +424,10 @@ def process_image_directory(input_dir, output_dir=None, width=None, height=None,
     
     print(f"Encontradas {len(images)} imágenes para procesar")
     
-    # Procesar cada imagen
-    for i, file_path in enumerate(images, 1):
+    # Determinar rutas de salida
+    input_files = []
+    output_files = []
+    for file_path in images:
         # Determinar extensión de salida
         if output_format:
             output_extension = f".{output_format}"
@@ -256,15 +435,31 @@ def process_image_directory(input_dir, output_dir=None, width=None, height=None,
             output_extension = file_path.suffix
         
         output_file = output_path / f"{file_path.stem}_retro-c{color_depth}-p{pixel_size}{output_extension}"
-        
-        print(f"Procesando imagen {i}/{len(images)}: {file_path.name}")
-        
-        # Procesar la imagen
-        retro_effect(
-            str(file_path), str(output_file), width, height, 
-            color_depth, pixel_size, add_dialog, dialog_text,
-            aspect_ratio, aspect_method, quality, output_format
-        )
+        input_files.append(str(file_path))
+        output_files.append(str(output_file))
+    
+    # Opciones comunes a todas las imágenes
+    worker = partial(
+        _retro_effect_worker, width=width, height=height,
+        color_depth=color_depth, pixel_size=pixel_size,
+        add_dialog=add_dialog, dialog_text=dialog_text,
+        aspect_ratio=aspect_ratio, aspect_method=aspect_method,
+        quality=quality, output_format=output_format, palette=palette,
+        backend=backend
+    )
+    
+    # Procesar las imágenes en paralelo (cada una es independiente)
+    # Cada worker carga la fuente del diálogo una sola vez al arrancar
+    # (get_font la mantiene en caché durante el resto del lote)
+    initializer, initargs = None, ()
+    if add_dialog and dialog_text:
+        initializer, initargs = get_font, (pixel_size * 3,)
+    
+    max_workers = min(workers or os.cpu_count() or 1, len(images))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=initializer,
+                             initargs=initargs) as executor:
+        list(tqdm(executor.map(worker, input_files, output_files),
+                  total=len(images), desc="Procesando imágenes"))
     
     print(f"\nProceso completo: {len(images)} imágenes convertidas")
     print(f"Resultados guardados en: {output_path}")
@@ -293,6 +488,10 @@ if __name__ == "__main__":
                                help='Calidad de la imagen para formatos con compresión (1-100, mayor es mejor)')
     parser_single.add_argument('--format', choices=['png', 'jpg', 'webp'], 
                                help='Formato de salida (default: mantener formato original)')
+    parser_single.add_argument('--palette', choices=['adaptive', 'fixed'], default='adaptive',
+                               help='Paleta: adaptive (calculada por imagen) o fixed (RGB fija, más rápida)')
+    parser_single.add_argument('--backend', choices=['pil', 'vips'], default='pil',
+                               help='Motor de procesamiento: pil o vips (requiere pyvips, usa paleta fija)')
     
     # Subparser para procesamiento por lotes
     parser_batch = subparsers.add_parser('batch', help='Procesar múltiples imágenes en un directorio')
@@ -312,6 +511,12 @@ if __name__ == "__main__":
                              help='Calidad de la imagen para formatos con compresión (1-100, mayor es mejor)')
     parser_batch.add_argument('--format', choices=['png', 'jpg', 'webp'], 
                              help='Formato de salida (default: mantener formato original)')
+    parser_batch.add_argument('--palette', choices=['adaptive', 'fixed'], default='adaptive',
+                             help='Paleta: adaptive (calculada por imagen) o fixed (RGB fija, más rápida)')
+    parser_batch.add_argument('--backend', choices=['pil', 'vips'], default='pil',
+                             help='Motor de procesamiento: pil o vips (requiere pyvips, usa paleta fija)')
+    parser_batch.add_argument('--workers', type=int, default=None,
+                             help='Número de procesos en paralelo (default: todos los núcleos)')
     
     args = parser.parse_args()
     
@@ -325,13 +530,15 @@ if __name__ == "__main__":
             retro_effect(
                 args.input, args.output, args.width, args.height, 
                 args.colors, args.pixel_size, args.dialog, args.text,
-                aspect_ratio_value, args.aspect_method, args.quality, args.format
+                aspect_ratio_value, args.aspect_method, args.quality, args.format,
+                args.palette, args.backend
             )
         elif args.mode == 'batch':
             process_image_directory(
                 args.input_dir, args.output_dir, args.width, args.height,
                 args.colors, args.pixel_size, args.dialog, args.text,
-                aspect_ratio_value, args.aspect_method, args.quality, args.format
+                aspect_ratio_value, args.aspect_method, args.quality, args.format,
+                args.palette, args.workers, args.backend
             )
         else:
             parser.print_help()
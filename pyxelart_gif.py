@@ -1,14 +1,44 @@
 #!/usr/bin/env python3
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw, ImageFont, GifImagePlugin
 import cv2
-import imageio
 import argparse
 import os
+import queue
 import tempfile
+import threading
+from contextlib import closing
+from fractions import Fraction
+from functools import lru_cache
 from pathlib import Path
 from tqdm import tqdm
 
+try:
+    import av
+except ImportError:
+    av = None
+
+# Frames repartidos por todo el video con los que se calcula la paleta
+PALETTE_SAMPLE_FRAMES = 8
+
+@lru_cache(maxsize=32)
+def get_font(size):
+    """Carga (una sola vez por tamaño) la fuente para el cuadro de diálogo"""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except:
+        return ImageFont.load_default()
+
+def ratio_matches(width, height, target_ratio):
+    """
+    Indica si unas dimensiones ya tienen la relación de aspecto objetivo
+    
+    Compara de forma exacta con enteros (width/height reducido como fracción), sin
+    errores de redondeo. Si la relación objetivo llega como float se convierte antes
+    a la fracción más cercana (p. ej. 4/3 -> Fraction(4, 3)).
+    """
+    return Fraction(width, height) == Fraction(target_ratio).limit_denominator(10000)
+
 def apply_aspect_ratio(frame, target_ratio, method='resize'):
     """
     Aplica una relación de aspecto específica al frame
@@ -24,7 +54,7 @@ def apply_aspect_ratio(frame, target_ratio, method='resize'):
     h, w = frame.shape[:2]
     current_ratio = w / h
     
-    if abs(current_ratio - target_ratio) < 0.01:
+    if ratio_matches(w, h, target_ratio):
         # Ya tiene la relación de aspecto correcta
         return frame
     
@@ -50,11 +80,11 @@ def apply_aspect_ratio(frame, target_ratio, method='resize'):
     return frame
 
 def parse_aspect_ratio(aspect_str):
-    """Convierte una cadena de relación de aspecto a un valor numérico"""
+    """Convierte una cadena de relación de aspecto a una fracción exacta"""
     if aspect_str == "4:3":
-        return 4/3
+        return Fraction(4, 3)
     elif aspect_str == "1:1":
-        return 1.0
+        return Fraction(1)
     elif aspect_str == "original":
         return None
     else:
@@ -62,29 +92,176 @@ def parse_aspect_ratio(aspect_str):
             # Intentar interpretar como "x:y"
             parts = aspect_str.split(":")
             if len(parts) == 2:
-                return float(parts[0]) / float(parts[1])
+                return Fraction(parts[0]) / Fraction(parts[1])
         except:
             pass
         
         raise ValueError(f"Formato de relación de aspecto no reconocido: {aspect_str}")
 
-def apply_retro_effect(frame, color_depth=16, pixel_size=4, add_dialog=False, dialog_text=""):
-    """Aplica el efecto retro a un frame individual"""
-    # Convertir frame de OpenCV (BGR) a PIL (RGB)
-    img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+def iter_frames_cv2(cap, frame_skip=1):
+    """
+    Itera los frames de un cv2.VideoCapture entregando uno de cada `frame_skip`
     
-    # Aplicar reducción de colores
-    img = img.convert('P', palette=Image.ADAPTIVE, colors=color_depth)
-    img = img.convert('RGB')
+    Los frames descartados solo se avanzan con grab(), sin convertirlos a imagen.
+    """
+    frame_count = 0
+    while True:
+        if frame_count % frame_skip == 0:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+        elif not cap.grab():
+            break
+        frame_count += 1
+
+def iter_frames_av(input_path, frame_skip=1):
+    """
+    Itera los frames de un video con el decodificador multihilo de PyAV
     
-    # Pixelado
-    pixel_width = img.width // pixel_size
-    pixel_height = img.height // pixel_size
-    img = img.resize((pixel_width, pixel_height), Image.NEAREST)
-    img = img.resize((img.width * pixel_size, img.height * pixel_size), Image.NEAREST)
+    libav decodifica en paralelo (por frames o slices). Solo los frames que se
+    entregan se convierten a array BGR; el resto se descartan tras decodificarse.
+    """
+    container = av.open(input_path)
+    try:
+        stream = container.streams.video[0]
+        stream.thread_type = 'AUTO'
+        for frame_count, frame in enumerate(container.decode(stream)):
+            if frame_count % frame_skip == 0:
+                yield frame.to_ndarray(format='bgr24')
+    finally:
+        container.close()
+
+def read_frames(frames, prefetch=16):
+    """
+    Consume un iterador de frames en un hilo en segundo plano
+    
+    El decodificador se adelanta hasta `prefetch` frames mientras el hilo
+    principal aplica el efecto, solapando la decodificación con el procesado.
+    
+    Args:
+        frames: Iterador de frames (iter_frames_cv2 o iter_frames_av)
+        prefetch: Número máximo de frames decodificados en espera
+        
+    Yields:
+        Los frames (BGR), en orden
+        
+    Raises:
+        La excepción del decodificador, si falla a mitad del video
+    """
+    buffer = queue.Queue(maxsize=prefetch)
+    error = []
+    stop = threading.Event()
+    
+    def put(item):
+        # Con espera limitada: si el consumidor ya terminó (por un error o porque
+        # dejó de iterar), nadie vaciará la cola y el productor debe salir
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+    
+    def producer():
+        try:
+            for frame in frames:
+                if not put(frame):
+                    break
+        except BaseException as e:
+            # Se relanza en el hilo principal al llegar al final de la cola
+            error.append(e)
+        finally:
+            # Cerrar el iterador libera el video (p. ej. el contenedor de PyAV)
+            if hasattr(frames, 'close'):
+                frames.close()
+            put(None)
+    
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    
+    try:
+        while True:
+            frame = buffer.get()
+            if frame is None:
+                break
+            yield frame
+    finally:
+        stop.set()
+        thread.join()
+    
+    if error:
+        raise error[0]
+
+def sample_frames(cap, total_frames, count=PALETTE_SAMPLE_FRAMES):
+    """
+    Lee `count` frames repartidos a lo largo del video (saltando con seek)
+    
+    Devuelve la captura a su posición inicial. Si no se conoce el número de
+    frames devuelve una lista vacía.
+    """
+    if total_frames <= 0:
+        return []
+    
+    samples = []
+    for index in sorted({i * total_frames // count for i in range(count)}):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = cap.read()
+        if ret:
+            samples.append(frame)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    return samples
+
+def build_palette(frames, color_depth=16):
+    """
+    Calcula una paleta adaptativa a partir de uno o varios frames
+    
+    La paleta se reutiliza en el resto de frames del GIF para no repetir
+    el cálculo de la paleta en cada uno. Con frames repartidos por todo el
+    video, un inicio oscuro (o un fundido) no deja la paleta sin colores.
+    
+    Args:
+        frames: El frame de OpenCV (BGR) de referencia, o una lista de frames
+            del mismo tamaño
+        color_depth: Número de colores de la paleta
+        
+    Returns:
+        Una imagen PIL en modo 'P' que contiene la paleta
+    """
+    frame = frames if isinstance(frames, np.ndarray) else np.concatenate(frames, axis=0)
+    img = Image.fromarray(np.ascontiguousarray(frame[..., ::-1]))
+    return img.quantize(colors=color_depth, method=Image.Quantize.FASTOCTREE,
+                        dither=Image.Dither.NONE)
+
+def apply_retro_effect(frame, color_depth=16, pixel_size=4, add_dialog=False, dialog_text="",
+                       palette=None):
+    """Aplica el efecto retro a un frame individual"""
+    # Pixelado: reducir con promedio por bloques directamente sobre el array de OpenCV
+    pixel_width = frame.shape[1] // pixel_size
+    pixel_height = frame.shape[0] // pixel_size
+    small = cv2.resize(frame, (pixel_width, pixel_height), interpolation=cv2.INTER_AREA)
+    
+    # Convertir frame de OpenCV (BGR) a PIL (RGB) invirtiendo el eje de canales
+    img = Image.fromarray(np.ascontiguousarray(small[..., ::-1]))
+    
+    # Aplicar reducción de colores sobre la imagen reducida
+    # (reutilizando la paleta si se proporciona)
+    if palette is not None:
+        img = img.quantize(palette=palette, dither=Image.Dither.NONE)
+    else:
+        img = img.quantize(colors=color_depth, method=Image.Quantize.FASTOCTREE,
+                           dither=Image.Dither.NONE)
+    small = np.asarray(img.convert('RGB'))
+    
+    # Ampliar de nuevo a bloques de pixel_size
+    np_img = cv2.resize(small, (pixel_width * pixel_size, pixel_height * pixel_size),
+                        interpolation=cv2.INTER_NEAREST)
     
     # Opcional: añadir cuadro de diálogo estilo retro
     if add_dialog and dialog_text:
+        img = Image.fromarray(np_img)
+
         dialog_height = pixel_size * 10
         canvas = Image.new('RGB', (img.width, img.height + dialog_height), (50, 50, 50))
         canvas.paste(img, (0, 0))
@@ -93,23 +270,56 @@ def apply_retro_effect(frame, color_depth=16, pixel_size=4, add_dialog=False, di
         dialog_box = (10, img.height + 5, img.width - 10, img.height + dialog_height - 5)
         draw.rectangle(dialog_box, fill=(80, 80, 80), outline=(200, 200, 200))
         
-        try:
-            font = ImageFont.truetype("arial.ttf", pixel_size * 3)
-        except:
-            font = ImageFont.load_default()
-            
+        font = get_font(pixel_size * 3)
         text_pos = (dialog_box[0] + 10, dialog_box[1] + 10)
         draw.text(text_pos, dialog_text, fill=(0, 0, 200), font=font)
         
-        img = canvas
+        np_img = np.array(canvas)
     
     # Añadir ruido/dithering para estética retro
-    np_img = np.array(img)
     noise = np.random.randint(0, 15, np_img.shape)
     np_img = np.clip(np_img + noise, 0, 255).astype(np.uint8)
     
     return np_img
 
+class GifWriter:
+    """
+    Escribe un GIF animado en disco frame a frame
+    
+    El escritor de GIF de Pillow (y el de imageio, que lo usa) guarda todos los
+    frames en memoria hasta cerrar el archivo. Aquí cada frame se cuantiza con su
+    propia paleta local y se escribe en cuanto llega, así la memoria no crece con
+    la duración del video. Se usa como el escritor de imageio: append_data() y
+    close(), o dentro de un bloque with.
+    """
+    
+    def __init__(self, path, fps=10):
+        self.file = open(path, 'wb')
+        self.duration = 1000 / fps
+        self.started = False
+    
+    def append_data(self, frame):
+        """Añade un frame RGB (array de numpy) al final del GIF"""
+        img = Image.fromarray(frame).convert('P', palette=Image.Palette.ADAPTIVE)
+        if not self.started:
+            # Cabecera global (tamaño del lienzo y paleta del primer frame)
+            header, _ = GifImagePlugin.getheader(img, info={'duration': self.duration})
+            self.file.writelines(header)
+            self.started = True
+        self.file.writelines(GifImagePlugin.getdata(img, duration=self.duration,
+                                                    include_color_table=True))
+    
+    def close(self):
+        if not self.file.closed:
+            self.file.write(b';')  # Fin del GIF
+            self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
 def video_to_retro_gif(input_path, output_path=None, width=None, height=None, 
                      color_depth=16, pixel_size=4, frame_skip=1, fps=10, 
                      add_dialog=False, dialog_text="", aspect_ratio=None, aspect_method='resize'):
@@ -135,9 +345,6 @@ def video_to_retro_gif(input_path, output_path=None, width=None, height=None,
     if not height:
         height = original_height
     
-    # Lista para almacenar frames procesados
-    processed_frames = []
-    
     # Directorio temporal para frames
     temp_dir = tempfile.mkdtemp()
     
@@ -147,48 +354,57 @@ def video_to_retro_gif(input_path, output_path=None, width=None, height=None,
     print(f"  Configuración: {color_depth} colores, pixelado {pixel_size}, salto de frames {frame_skip}")
     
     if aspect_ratio is not None:
-        print(f"  Relación de aspecto: {aspect_ratio:.2f} (método: {aspect_method})")
+        print(f"  Relación de aspecto: {float(aspect_ratio):.2f} (método: {aspect_method})")
     
-    # Procesar frames
-    frame_count = 0
+    def prepare_frame(frame):
+        # Aplicar relación de aspecto si se especifica
+        if aspect_ratio is not None:
+            frame = apply_aspect_ratio(frame, aspect_ratio, aspect_method)
+        
+        # Redimensionar si se especifica
+        if frame.shape[1] != width or frame.shape[0] != height:
+            frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_LANCZOS4)
+        return frame
+    
+    # Calcular la paleta con frames de todo el video y reutilizarla en todos
+    # (si no se pueden muestrear, se usa el primer frame)
+    samples = [prepare_frame(frame) for frame in sample_frames(cap, total_frames)]
+    palette = build_palette(samples, color_depth) if samples else None
+    
+    # Decodificar con PyAV (multihilo) si está disponible, si no con OpenCV
+    if av is not None:
+        cap.release()
+        frames = iter_frames_av(input_path, frame_skip)
+    else:
+        frames = iter_frames_cv2(cap, frame_skip)
+    
+    # Procesar frames (la decodificación corre en un hilo aparte) y escribirlos
+    # al GIF a medida que se generan, sin acumularlos en memoria
     processed_count = 0
     
-    with tqdm(total=total_frames//frame_skip) as pbar:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+    # closing() detiene el hilo del decodificador aunque se salga con un error
+    with GifWriter(output_path, fps=fps) as writer, \
+            closing(read_frames(frames)) as decoded, \
+            tqdm(total=total_frames//frame_skip) as pbar:
+        for frame in decoded:
+            frame = prepare_frame(frame)
             
-            # Saltar frames según frame_skip
-            if frame_count % frame_skip == 0:
-                # Aplicar relación de aspecto si se especifica
-                if aspect_ratio is not None:
-                    frame = apply_aspect_ratio(frame, aspect_ratio, aspect_method)
-                
-                # Redimensionar si se especifica
-                if frame.shape[1] != width or frame.shape[0] != height:
-                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_LANCZOS4)
-                
-                # Aplicar efecto retro
-                retro_frame = apply_retro_effect(
-                    frame, color_depth, pixel_size, add_dialog, dialog_text
-                )
-                
-                # Guardar frame en lista
-                processed_frames.append(retro_frame)
-                processed_count += 1
-                pbar.update(1)
-                
-            frame_count += 1
+            if palette is None:
+                palette = build_palette(frame, color_depth)
+            
+            # Aplicar efecto retro
+            retro_frame = apply_retro_effect(
+                frame, color_depth, pixel_size, add_dialog, dialog_text, palette
+            )
+            
+            # Escribir frame en el GIF
+            writer.append_data(retro_frame)
+            processed_count += 1
+            pbar.update(1)
     
     cap.release()
     
-    print(f"Guardando GIF ({processed_count} frames)...")
-    
-    # Guardar como GIF
-    imageio.mimsave(output_path, processed_frames, fps=fps)
-    
-    print(f"GIF retro guardado en: {output_path}")
+    print(f"GIF retro guardado en: {output_path} ({processed_count} frames)")
     return output_path
 
 def process_video_directory(input_dir, output_dir=None, width=None, height=None, 
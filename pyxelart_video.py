@@ -4,54 +4,355 @@ from PIL import Image, ImageDraw, ImageFont
 import cv2
 import argparse
 import os
-import tempfile
 import subprocess
+import tempfile
+import threading
+import queue
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from fractions import Fraction
+from functools import lru_cache, partial
 from pathlib import Path
 from tqdm import tqdm
 
-def apply_retro_effect(frame, color_depth=16, pixel_size=4, add_dialog=False, dialog_text=""):
-    """Aplica el efecto retro a un frame individual"""
-    # Convertir frame de OpenCV (BGR) a PIL (RGB)
-    img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Matriz de Bayer 8x8 para el tramado ordenado, escalada al rango 0-14
+# (la misma amplitud que tenía el ruido aleatorio)
+BAYER8 = (np.array([
+    [ 0, 32,  8, 40,  2, 34, 10, 42],
+    [48, 16, 56, 24, 50, 18, 58, 26],
+    [12, 44,  4, 36, 14, 46,  6, 38],
+    [60, 28, 52, 20, 62, 30, 54, 22],
+    [ 3, 35, 11, 43,  1, 33,  9, 41],
+    [51, 19, 59, 27, 49, 17, 57, 25],
+    [15, 47,  7, 39, 13, 45,  5, 37],
+    [63, 31, 55, 23, 61, 29, 53, 21],
+]) * 15 // 64).astype(np.uint8)
+
+# Lotes de frames para apply_retro_effect_batch: como máximo MAX_BATCH_FRAMES frames
+# y BATCH_BYTES bytes por lote (para que el lote quepa en la caché L3)
+MAX_BATCH_FRAMES = 8
+BATCH_BYTES = 8 * 1024 * 1024
+
+# Frames repartidos por todo el video con los que se calcula la paleta
+PALETTE_SAMPLE_FRAMES = 8
+
+@lru_cache(maxsize=8)
+def get_bayer_tile(height, width):
+    """Devuelve la matriz de Bayer replicada a (alto, ancho, 3), calculada una sola vez"""
+    reps = (-(-height // 8), -(-width // 8))
+    tile = np.tile(BAYER8, reps)[:height, :width]
+    return np.ascontiguousarray(np.repeat(tile[:, :, None], 3, axis=2))
+
+@lru_cache(maxsize=8)
+def get_inverted_bayer_tile(height, width):
+    """Devuelve 255 - get_bayer_tile(alto, ancho), calculado una sola vez"""
+    return 255 - get_bayer_tile(height, width)
+
+@lru_cache(maxsize=32)
+def get_font(size):
+    """Carga (una sola vez por tamaño) la fuente para el cuadro de diálogo"""
+    try:
+        return ImageFont.truetype("arial.ttf", size)
+    except:
+        return ImageFont.load_default()
+
+@lru_cache(maxsize=8)
+def get_dialog_strip(height, width, pixel_size, dialog_text, font=None):
+    """
+    Devuelve la franja del cuadro de diálogo que va debajo de un frame de alto x ancho
+    
+    Se dibuja con PIL una sola vez por combinación de parámetros y se guarda en BGR
+    con el tramado de Bayer ya aplicado, lista para copiar debajo de cada frame.
+    """
+    # Se dibuja directamente en orden BGR: por eso el azul del texto es (200, 0, 0)
+    dialog_height = pixel_size * 10
+    strip = Image.new('RGB', (width, dialog_height), (50, 50, 50))
+    
+    draw = ImageDraw.Draw(strip)
+    dialog_box = (10, 5, width - 10, dialog_height - 5)
+    draw.rectangle(dialog_box, fill=(80, 80, 80), outline=(200, 200, 200))
+    
+    if font is None:
+        font = get_font(pixel_size * 3)
+    
+    text_pos = (dialog_box[0] + 10, dialog_box[1] + 10)
+    draw.text(text_pos, dialog_text, fill=(200, 0, 0), font=font)
+    
+    # Tramado de las filas que ocupa la franja en el frame completo
+    bayer = get_bayer_tile(height + dialog_height, width)[height:]
+    return cv2.add(np.asarray(strip), bayer)
+
+def sample_frames(cap, total_frames, count=PALETTE_SAMPLE_FRAMES):
+    """
+    Lee `count` frames repartidos a lo largo del video (saltando con seek)
     
-    # Aplicar reducción de colores
-    img = img.convert('P', palette=Image.ADAPTIVE, colors=color_depth)
-    img = img.convert('RGB')
+    Devuelve la captura a su posición inicial. Si no se conoce el número de
+    frames devuelve una lista vacía.
+    """
+    if total_frames <= 0:
+        return []
+    
+    samples = []
+    for index in sorted({i * total_frames // count for i in range(count)}):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        ret, frame = cap.read()
+        if ret:
+            samples.append(frame)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+    return samples
+
+def build_palette_lut(frames, color_depth=16):
+    """
+    Calcula una paleta con k-means y la tabla de búsqueda (LUT) para aplicarla
     
-    # Pixelado
-    pixel_width = img.width // pixel_size
-    pixel_height = img.height // pixel_size
-    img = img.resize((pixel_width, pixel_height), Image.NEAREST)
-    img = img.resize((img.width * pixel_size, img.height * pixel_size), Image.NEAREST)
+    La paleta se obtiene una sola vez (de frames repartidos por el video, ver
+    sample_frames) y la LUT asigna a cada color, con 5 bits por canal, el color
+    más cercano de la paleta. Así la reducción de colores por frame es solo una
+    búsqueda en la tabla.
     
-    # Opcional: añadir cuadro de diálogo estilo retro
-    if add_dialog and dialog_text:
-        dialog_height = pixel_size * 10
-        canvas = Image.new('RGB', (img.width, img.height + dialog_height), (50, 50, 50))
-        canvas.paste(img, (0, 0))
+    Args:
+        frames: El frame de referencia (BGR) o una lista de frames
+        color_depth: Número de colores de la paleta
         
-        draw = ImageDraw.Draw(canvas)
-        dialog_box = (10, img.height + 5, img.width - 10, img.height + dialog_height - 5)
-        draw.rectangle(dialog_box, fill=(80, 80, 80), outline=(200, 200, 200))
+    Returns:
+        Array (32, 32, 32, 3) uint8 con el color de la paleta para cada celda
+    """
+    if isinstance(frames, np.ndarray):
+        frames = [frames]
+    
+    # Usar una muestra de los píxeles para que k-means sea rápido
+    per_frame = max(1, 20000 // len(frames))
+    samples = []
+    for frame in frames:
+        pixels = frame.reshape(-1, 3)
+        samples.append(pixels[::max(1, len(pixels) // per_frame)])
+    samples = np.concatenate(samples).astype(np.float32)
+    
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
+    _, _, centers = cv2.kmeans(samples, min(color_depth, len(samples)), None,
+                               criteria, 1, cv2.KMEANS_PP_CENTERS)
+    palette = np.clip(np.rint(centers), 0, 255).astype(np.uint8)
+    
+    # Centro de cada celda de la LUT y su color más cercano de la paleta
+    levels = np.arange(32, dtype=np.float32) * 8 + 4
+    grid = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+    distances = (centers ** 2).sum(axis=1) - 2 * grid @ centers.T
+    return palette[distances.argmin(axis=1)].reshape(32, 32, 32, 3)
+
+if numba is not None:
+    @numba.njit(parallel=True, nogil=True, cache=True, fastmath=True)
+    def _retro_kernel(frame, out, lut, bayer, pixel_size):
+        """
+        Pixelado, reducción de colores y tramado en una sola pasada sobre el frame
         
-        try:
-            font = ImageFont.truetype("arial.ttf", pixel_size * 3)
-        except:
-            font = ImageFont.load_default()
-            
-        text_pos = (dialog_box[0] + 10, dialog_box[1] + 10)
-        draw.text(text_pos, dialog_text, fill=(0, 0, 200), font=font)
+        Para cada bloque de pixel_size x pixel_size calcula el color medio, lo busca
+        en la LUT y escribe el bloque sumando la matriz de Bayer (ya replicada al
+        tamaño del frame) con saturación.
+        """
+        h, w = frame.shape[0], frame.shape[1]
+        rows = (h + pixel_size - 1) // pixel_size
+        cols = (w + pixel_size - 1) // pixel_size
+        for by in numba.prange(rows):
+            y0 = by * pixel_size
+            y1 = min(y0 + pixel_size, h)
+            for bx in range(cols):
+                x0 = bx * pixel_size
+                x1 = min(x0 + pixel_size, w)
+                
+                # Color medio del bloque
+                sb = 0
+                sg = 0
+                sr = 0
+                for y in range(y0, y1):
+                    for x in range(x0, x1):
+                        sb += frame[y, x, 0]
+                        sg += frame[y, x, 1]
+                        sr += frame[y, x, 2]
+                n = (y1 - y0) * (x1 - x0)
+                b = (sb + n // 2) // n
+                g = (sg + n // 2) // n
+                r = (sr + n // 2) // n
+                
+                # Color de la paleta y escritura del bloque con el tramado
+                color = lut[b >> 3, g >> 3, r >> 3]
+                for y in range(y0, y1):
+                    for x in range(x0, x1):
+                        for c in range(3):
+                            v = np.int32(color[c]) + np.int32(bayer[y, x, c])
+                            out[y, x, c] = 255 if v > 255 else v
+else:
+    _retro_kernel = None
+
+def block_means(frame, rows, cols, pixel_size):
+    """
+    Color medio de cada bloque de pixel_size x pixel_size, incluidos los bloques
+    incompletos del borde cuando el tamaño del frame no es múltiplo de pixel_size
+    
+    La zona de bloques completos se reduce con INTER_AREA; los bordes se promedian
+    con el mismo redondeo que el kernel de Numba.
+    
+    Returns:
+        Array (ceil(alto/pixel_size), ceil(ancho/pixel_size), 3) uint8
+    """
+    h, w = frame.shape[:2]
+    main_h, main_w = rows * pixel_size, cols * pixel_size
+    extra_h, extra_w = h - main_h, w - main_w
+    small = np.empty((rows + (extra_h > 0), cols + (extra_w > 0), 3), dtype=np.uint8)
+    
+    def mean(blocks, axes, n):
+        return (blocks.sum(axis=axes, dtype=np.uint32) + n // 2) // n
+    
+    if rows and cols:
+        small[:rows, :cols] = cv2.resize(frame[:main_h, :main_w], (cols, rows),
+                                         interpolation=cv2.INTER_AREA)
+    if extra_w and rows:
+        strip = frame[:main_h, main_w:].reshape(rows, pixel_size, extra_w, 3)
+        small[:rows, cols] = mean(strip, (1, 2), pixel_size * extra_w)
+    if extra_h and cols:
+        strip = frame[main_h:, :main_w].reshape(extra_h, cols, pixel_size, 3)
+        small[rows, :cols] = mean(strip, (0, 2), extra_h * pixel_size)
+    if extra_h and extra_w:
+        small[rows, cols] = mean(frame[main_h:, main_w:], (0, 1), extra_h * extra_w)
+    return small
+
+def make_retro_kernel(lut, height, width, pixel_size=4, dialog_strip=None):
+    """
+    Prepara la función del efecto retro para frames de un tamaño y configuración fijos
+    
+    La LUT, el tamaño de pixelado, las dimensiones, la matriz de Bayer ya replicada al
+    tamaño del frame y la franja del diálogo se resuelven una sola vez, y la función
+    devuelta solo recibe el frame y sus buffers.
+    
+    Args:
+        lut: La LUT de build_palette_lut
+        height, width: Dimensiones de los frames de entrada
+        pixel_size: Tamaño de pixelado
+        dialog_strip: Franja de get_dialog_strip para añadir debajo, o None
         
-        img = canvas
+    Returns:
+        Función kernel(frame, scratch) que devuelve el frame con el efecto (BGR). scratch
+        es un diccionario con buffers reutilizables: 'small' (alto/pixel_size,
+        ancho/pixel_size, 3) y 'out' (alto final, ancho, 3); si tiene 'out', el frame
+        devuelto es ese mismo buffer.
+    """
+    rows, cols = height // pixel_size, width // pixel_size
+    small_size = (cols, rows)
+    # Si el tamaño no es múltiplo de pixel_size, los bloques del borde derecho e
+    # inferior son más pequeños y se promedian aparte (igual que el kernel de Numba)
+    partial_blocks = rows * pixel_size != height or cols * pixel_size != width
+    out_height = height if dialog_strip is None else height + dialog_strip.shape[0]
+    bayer = get_bayer_tile(height, width)
+    
+    def get_out(scratch):
+        out = scratch.get('out')
+        if out is None:
+            out = np.empty((out_height, width, 3), dtype=np.uint8)
+        return out
+    
+    # Con Numba todo el efecto (sin diálogo) se hace en un único kernel
+    if _retro_kernel is not None and dialog_strip is None:
+        def kernel(frame, scratch):
+            out = get_out(scratch)
+            _retro_kernel(frame, out, lut, bayer, pixel_size)
+            return out
+        return kernel
+    
+    def kernel(frame, scratch):
+        out = get_out(scratch)
+        top = out[:height]
+        
+        # Pixelado: promedio por bloques directamente sobre el array BGR
+        if partial_blocks:
+            small = block_means(frame, rows, cols, pixel_size)
+        else:
+            small = cv2.resize(frame, small_size, dst=scratch.get('small'),
+                               interpolation=cv2.INTER_AREA)
+        
+        # Aplicar reducción de colores con la LUT sobre la imagen reducida
+        small = lut[small[..., 0] >> 3, small[..., 1] >> 3, small[..., 2] >> 3]
+        
+        # Ampliar de nuevo al tamaño original en bloques, en la parte superior de la salida
+        if partial_blocks:
+            # Bloques completos también en el borde, recortados después al tamaño del frame
+            big_size = (small.shape[1] * pixel_size, small.shape[0] * pixel_size)
+            top[:] = cv2.resize(small, big_size, interpolation=cv2.INTER_NEAREST)[:height, :width]
+        else:
+            cv2.resize(small, (width, height), dst=top, interpolation=cv2.INTER_NEAREST)
+        
+        # Opcional: cuadro de diálogo debajo del frame (solo se copia si el buffer
+        # de salida no lo tiene ya)
+        if dialog_strip is not None and scratch.get('dialog') is not dialog_strip:
+            out[height:] = dialog_strip
+            scratch['dialog'] = dialog_strip
+        
+        # Añadir tramado ordenado (Bayer) para estética retro (suma uint8 con saturación)
+        cv2.add(top, bayer, dst=top)
+        return out
+    return kernel
+
+def apply_retro_effect(frame, color_depth=16, pixel_size=4, add_dialog=False, dialog_text="",
+                       lut=None, font=None, scratch=None):
+    """
+    Aplica el efecto retro a un frame individual (BGR de entrada y de salida)
     
-    # Añadir ruido/dithering para estética retro
-    np_img = np.array(img)
-    noise = np.random.randint(0, 15, np_img.shape)
-    np_img = np.clip(np_img + noise, 0, 255).astype(np.uint8)
+    Para procesar muchos frames con la misma configuración es mejor preparar la
+    función una vez con make_retro_kernel; scratch tiene el mismo formato.
+    """
+    if lut is None:
+        lut = build_palette_lut(frame, color_depth)
     
-    # Convertir de RGB a BGR para OpenCV
-    return cv2.cvtColor(np_img, cv2.COLOR_RGB2BGR)
+    h, w = frame.shape[:2]
+    dialog_strip = None
+    if add_dialog and dialog_text:
+        dialog_strip = get_dialog_strip(h, w, pixel_size, dialog_text, font)
+    
+    kernel = make_retro_kernel(lut, h, w, pixel_size, dialog_strip)
+    return kernel(frame, scratch if scratch is not None else {})
 
+def apply_retro_effect_batch(frames, lut, pixel_size=4, out=None):
+    """
+    Aplica el efecto retro (sin diálogo) a un lote de frames a la vez
+    
+    El pixelado, la reducción de colores con la LUT y la ampliación se hacen con
+    operaciones vectorizadas sobre todo el lote, en lugar de varias llamadas por frame.
+    
+    Args:
+        frames: Array (K, alto, ancho, 3) BGR; alto y ancho múltiplos de pixel_size
+        lut: La LUT de build_palette_lut
+        pixel_size: Tamaño de pixelado
+        out: Buffer opcional con la misma forma que frames para el resultado
+        
+    Returns:
+        El lote de frames con el efecto (out si se pasa)
+    """
+    k, h, w = frames.shape[:3]
+    if out is None:
+        out = np.empty_like(frames)
+    
+    # Pixelado: media redondeada de cada bloque de pixel_size x pixel_size
+    blocks = frames.reshape(k, h // pixel_size, pixel_size, w // pixel_size, pixel_size, 3)
+    n = pixel_size * pixel_size
+    small = ((blocks.sum(axis=(2, 4), dtype=np.uint32) + n // 2) // n).astype(np.uint8)
+    
+    # Reducción de colores con la LUT para todo el lote en una sola búsqueda
+    small = lut[small[..., 0] >> 3, small[..., 1] >> 3, small[..., 2] >> 3]
+    
+    # Ampliar en bloques escribiendo directamente en la salida
+    out_blocks = out.reshape(k, h // pixel_size, pixel_size, w // pixel_size, pixel_size, 3)
+    out_blocks[:] = small[:, :, None, :, None, :]
+    
+    # Añadir tramado ordenado (Bayer) con saturación a todo el lote: limitando antes
+    # cada valor a 255 - tramado, la suma uint8 no puede desbordar
+    np.minimum(out, get_inverted_bayer_tile(h, w), out=out)
+    np.add(out, get_bayer_tile(h, w), out=out)
+    return out
+
+@lru_cache(maxsize=None)
 def get_video_codec(output_format):
     """Devuelve el codec adecuado según el formato de salida"""
     format_codecs = {
@@ -63,6 +364,7 @@ def get_video_codec(output_format):
     
     return format_codecs.get(output_format.lower(), 'mp4v')
 
+@lru_cache(maxsize=None)
 def check_ffmpeg():
     """Verifica si FFmpeg está instalado en el sistema"""
     try:
@@ -74,6 +376,16 @@ def check_ffmpeg():
     except FileNotFoundError:
         return False
 
+def ratio_matches(width, height, target_ratio):
+    """
+    Indica si unas dimensiones ya tienen la relación de aspecto objetivo
+    
+    Compara de forma exacta con enteros (width/height reducido como fracción), sin
+    errores de redondeo. Si la relación objetivo llega como float se convierte antes
+    a la fracción más cercana (p. ej. 4/3 -> Fraction(4, 3)).
+    """
+    return Fraction(width, height) == Fraction(target_ratio).limit_denominator(10000)
+
 def apply_aspect_ratio(frame, target_ratio, method='resize'):
     """
     Aplica una relación de aspecto específica al frame
@@ -89,14 +401,16 @@ def apply_aspect_ratio(frame, target_ratio, method='resize'):
     h, w = frame.shape[:2]
     current_ratio = w / h
     
-    if abs(current_ratio - target_ratio) < 0.01:
+    if ratio_matches(w, h, target_ratio):
         # Ya tiene la relación de aspecto correcta
         return frame
     
     if method == 'resize':
         # Calcular nuevas dimensiones manteniendo la altura
         new_width = int(h * target_ratio)
-        return cv2.resize(frame, (new_width, h), interpolation=cv2.INTER_LANCZOS4)
+        # El resultado se pixela después: AREA al reducir y LINEAR al ampliar bastan
+        interpolation = cv2.INTER_AREA if new_width < w else cv2.INTER_LINEAR
+        return cv2.resize(frame, (new_width, h), interpolation=interpolation)
     
     elif method == 'crop':
         if current_ratio > target_ratio:
@@ -114,12 +428,47 @@ def apply_aspect_ratio(frame, target_ratio, method='resize'):
     
     return frame
 
+def build_scale_filter(src_width, src_height, width, height, target_ratio=None, method='resize'):
+    """
+    Construye el filtro de FFmpeg equivalente a apply_aspect_ratio + redimensionar
+    
+    Args:
+        src_width, src_height: Dimensiones del video original
+        width, height: Dimensiones finales de los frames
+        target_ratio: La relación de aspecto objetivo (ancho/alto) o None
+        method: 'resize' para estirar la imagen, 'crop' para recortar
+        
+    Returns:
+        La cadena para -vf, o None si no hay que tocar los frames
+    """
+    filters = []
+    w, h = src_width, src_height
+    
+    if target_ratio is not None and method == 'crop' and not ratio_matches(w, h, target_ratio):
+        # Mismo recorte centrado que apply_aspect_ratio
+        if w / h > target_ratio:
+            new_w = int(h * target_ratio)
+            filters.append(f"crop={new_w}:{h}:{(w - new_w) // 2}:0")
+            w = new_w
+        else:
+            new_h = int(w / target_ratio)
+            filters.append(f"crop={w}:{new_h}:0:{(h - new_h) // 2}")
+            h = new_h
+    
+    # Con 'resize' el estirado y el redimensionado final son un único escalado
+    # ('area' al reducir y 'bilinear' al ampliar, como en OpenCV)
+    if (w, h) != (width, height):
+        flags = 'area' if width * height < w * h else 'bilinear'
+        filters.append(f"scale={width}:{height}:flags={flags}")
+    
+    return ",".join(filters) or None
+
 def parse_aspect_ratio(aspect_str):
-    """Convierte una cadena de relación de aspecto a un valor numérico"""
+    """Convierte una cadena de relación de aspecto a una fracción exacta"""
     if aspect_str == "4:3":
-        return 4/3
+        return Fraction(4, 3)
     elif aspect_str == "1:1":
-        return 1.0
+        return Fraction(1)
     elif aspect_str == "original":
         return None
     else:
@@ -127,13 +476,61 @@ def parse_aspect_ratio(aspect_str):
             # Intentar interpretar como "x:y"
             parts = aspect_str.split(":")
             if len(parts) == 2:
-                return float(parts[0]) / float(parts[1])
+                return Fraction(parts[0]) / Fraction(parts[1])
         except:
             pass
         
         raise ValueError(f"Formato de relación de aspecto no reconocido: {aspect_str}")
 
-def get_ffmpeg_codec(output_format):
+# Codificadores H.264 por hardware según la opción --hwaccel
+HW_ENCODERS = {
+    'nvenc': 'h264_nvenc',
+    'qsv': 'h264_qsv',
+    'vaapi': 'h264_vaapi',
+}
+
+# Equivalencia de los presets de x264 con los de NVENC (p1 = más rápido, p7 = mejor calidad)
+NVENC_PRESETS = {
+    'ultrafast': 'p1', 'superfast': 'p1', 'veryfast': 'p2',
+    'faster': 'p3', 'fast': 'p3', 'medium': 'p4',
+    'slow': 'p5', 'slower': 'p6', 'veryslow': 'p7',
+}
+
+@lru_cache(maxsize=None)
+def get_ffmpeg_encoders():
+    """Devuelve los nombres de los codificadores disponibles en FFmpeg (se consulta una vez)"""
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               text=True)
+    except FileNotFoundError:
+        return frozenset()
+    
+    # Las líneas de codificadores tienen la forma " V..... nombre  descripción"
+    encoders = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'VAS':
+            encoders.add(parts[1])
+    return frozenset(encoders)
+
+@lru_cache(maxsize=None)
+def get_ffmpeg_hwaccels():
+    """Devuelve los métodos de decodificación por hardware de FFmpeg (se consulta una vez)"""
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-hwaccels'],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE,
+                               text=True)
+    except FileNotFoundError:
+        return frozenset()
+    
+    # La primera línea es el título "Hardware acceleration methods:"
+    return frozenset(line.strip() for line in result.stdout.splitlines()[1:] if line.strip())
+
+@lru_cache(maxsize=None)
+def get_ffmpeg_codec(output_format, hwaccel='none'):
     """Devuelve los parámetros de codec para FFmpeg según el formato de salida"""
     # Mapeo de extensiones a codecs para FFmpeg
     format_codecs = {
@@ -143,14 +540,219 @@ def get_ffmpeg_codec(output_format):
         '.mkv': 'libx264',
     }
     
-    return format_codecs.get(output_format.lower(), 'libx264')
+    codec = format_codecs.get(output_format.lower(), 'libx264')
+    
+    # Usar el codificador H.264 por hardware si se pide y FFmpeg lo tiene
+    if codec == 'libx264' and hwaccel in HW_ENCODERS:
+        hw_codec = HW_ENCODERS[hwaccel]
+        if hw_codec in get_ffmpeg_encoders():
+            return hw_codec
+        print(f"ADVERTENCIA: FFmpeg no tiene el codificador {hw_codec}, se usará {codec}")
+    
+    return codec
+
+def get_ffmpeg_quality_args(codec, quality=23, preset='medium'):
+    """Devuelve los parámetros de calidad y preset de FFmpeg adecuados para el codec"""
+    if codec == 'h264_nvenc':
+        return ['-rc', 'vbr', '-cq', str(quality), '-b:v', '0',
+                '-preset', NVENC_PRESETS.get(preset, 'p4')]
+    if codec == 'h264_qsv':
+        qsv_preset = preset if preset not in ('ultrafast', 'superfast') else 'veryfast'
+        return ['-global_quality', str(quality), '-preset', qsv_preset]
+    if codec == 'h264_vaapi':
+        return ['-qp', str(quality)]
+    return ['-crf', str(quality), '-preset', preset]
+
+# Método de decodificación por hardware de FFmpeg asociado a cada opción --hwaccel
+HW_DECODERS = {
+    'nvenc': 'cuda',
+    'qsv': 'qsv',
+    'vaapi': 'vaapi',
+}
+
+def open_decoder(input_path, hwaccel='none', video_filter=None):
+    """
+    Lanza FFmpeg para decodificar el video de entrada a frames BGR crudos por stdout
+    
+    Con hwaccel la decodificación se hace en la GPU (si FFmpeg lo admite) y, en
+    cualquier caso, en un proceso aparte que trabaja en paralelo con el procesado.
+    video_filter (-vf) permite recortar y escalar los frames ya en FFmpeg.
+    
+    Returns:
+        El proceso de FFmpeg (leer los frames de proc.stdout con read_frames). Sus
+        errores quedan en proc.error_log (ver decoder_error)
+    """
+    ffmpeg_cmd = ['ffmpeg', '-loglevel', 'error']
+    method = HW_DECODERS.get(hwaccel)
+    if method in get_ffmpeg_hwaccels():
+        ffmpeg_cmd += ['-hwaccel', method]
+    ffmpeg_cmd += [
+        '-i', input_path,
+        '-map', '0:v:0',
+    ]
+    if video_filter:
+        ffmpeg_cmd += ['-vf', video_filter]
+    ffmpeg_cmd += [
+        '-f', 'rawvideo',
+        '-pix_fmt', 'bgr24',
+        '-'
+    ]
+    # Los errores van a un archivo temporal y no a una tubería: si FFmpeg escribe
+    # muchos y nadie los lee, la tubería se llenaría y bloquearía la decodificación
+    error_log = tempfile.TemporaryFile()
+    proc = subprocess.Popen(ffmpeg_cmd, stdout=subprocess.PIPE, stderr=error_log)
+    proc.error_log = error_log
+    return proc
+
+def decoder_error(proc):
+    """Espera al decodificador y devuelve sus errores si terminó con fallo (None si no)"""
+    returncode = proc.wait()
+    with proc.error_log as error_log:
+        if returncode == 0:
+            return None
+        error_log.seek(0)
+        message = error_log.read().decode(errors='replace').strip()
+    return message or f"código de salida {returncode}"
+
+def read_frames(proc, width, height):
+    """Genera los frames (alto, ancho, 3) que el decodificador escribe por stdout"""
+    frame_size = width * height * 3
+    while True:
+        buf = proc.stdout.read(frame_size)
+        if len(buf) < frame_size:
+            break
+        yield np.frombuffer(buf, np.uint8).reshape(height, width, 3)
+
+def capture_frames(cap):
+    """Genera los frames de un cv2.VideoCapture"""
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame
+
+def open_encoder(input_path, output_path, width, height, fps, quality=23, preset='medium',
+                 hwaccel='none', tune=None, threads=0):
+    """
+    Lanza FFmpeg para codificar el video de salida en una sola pasada
+    
+    Los frames procesados se escriben en BGR crudo por stdin y FFmpeg los codifica
+    directamente junto con el audio del video original (si lo tiene).
+    threads limita los hilos del codificador (0 = automático).
+    
+    Returns:
+        El proceso de FFmpeg (escribir los frames en proc.stdin)
+    """
+    _, output_ext = os.path.splitext(output_path)
+    codec = get_ffmpeg_codec(output_ext, hwaccel)
+    
+    ffmpeg_cmd = ['ffmpeg', '-y', '-loglevel', 'error']
+    if codec == 'h264_vaapi':
+        ffmpeg_cmd += ['-vaapi_device', '/dev/dri/renderD128']
+    ffmpeg_cmd += [
+        '-f', 'rawvideo',               # Frames crudos desde stdin
+        '-pix_fmt', 'bgr24',
+        '-s', f'{width}x{height}',
+        '-r', str(fps),
+        '-i', '-',
+        '-i', input_path,               # Original, solo para el audio
+        '-map', '0:v:0',                # Video procesado
+        '-map', '1:a:0?',               # Audio del original, si existe
+        '-c:v', codec,
+    ]
+    # Calidad (menor = mejor) y preset de codificación (afecta velocidad de compresión y tamaño)
+    ffmpeg_cmd += get_ffmpeg_quality_args(codec, quality, preset)
+    if tune and codec == 'libx264':
+        ffmpeg_cmd += ['-tune', tune]   # Ajuste de x264 para el tipo de contenido
+    ffmpeg_cmd += ['-threads', str(threads)]   # Hilos del codificador (0 = automático)
+    
+    # yuv420p y nv12 submuestrean el color en bloques de 2x2 y no admiten tamaños
+    # impares: se añade una fila/columna negra para llegar al par siguiente
+    video_filters = []
+    if width % 2 or height % 2:
+        video_filters.append('pad=ceil(iw/2)*2:ceil(ih/2)*2')
+    if codec == 'h264_vaapi':
+        # VAAPI codifica desde superficies de la GPU
+        video_filters += ['format=nv12', 'hwupload']
+    else:
+        ffmpeg_cmd += ['-pix_fmt', 'yuv420p']   # Formato compatible con la mayoría de reproductores
+    if video_filters:
+        ffmpeg_cmd += ['-vf', ','.join(video_filters)]
+    ffmpeg_cmd += [
+        '-c:a', 'aac',                  # Codec de audio
+        '-b:a', '128k',                 # Bitrate de audio
+        '-shortest',                    # Terminar cuando la pista más corta termine
+    ]
+    if output_ext.lower() in ('.mp4', '.mov'):
+        ffmpeg_cmd += ['-movflags', '+faststart']   # Índice al principio: reproducción inmediata
+    ffmpeg_cmd.append(output_path)
+    return subprocess.Popen(ffmpeg_cmd, stdin=subprocess.PIPE)
+
+def write_in_background(stream, max_queued=16):
+    """
+    Lanza un hilo que escribe en stream (p. ej. el stdin de FFmpeg) los bloques de la cola
+    
+    Así, cuando el codificador va más lento y la tubería se llena, la espera no detiene
+    la decodificación ni el procesado de los siguientes frames.
+    
+    Args:
+        stream: El flujo binario de destino
+        max_queued: Bloques pendientes como máximo antes de bloquear a quien escribe
+        
+    Returns:
+        (write, finish, failed): write(bytes) encola un bloque (no hace nada si el hilo
+        ya falló); finish() espera a que se escriba todo y devuelve el error de escritura
+        (None si no hubo); failed es un threading.Event que se activa al fallar la escritura
+    """
+    chunks = queue.Queue(maxsize=max_queued)
+    failed = threading.Event()
+    errors = []
+    
+    def writer():
+        while True:
+            chunk = chunks.get()
+            if chunk is None:
+                break
+            try:
+                stream.write(chunk)
+            except OSError as e:
+                # FFmpeg terminó o el disco falló: se guarda el error y se avisa al hilo
+                # principal, que deja de encolar y lo informa al terminar
+                errors.append(e)
+                failed.set()
+                break
+    
+    def put(chunk):
+        # Con espera limitada, para no quedarse bloqueado si el hilo ya no vacía la cola
+        while not failed.is_set():
+            try:
+                chunks.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+    
+    def finish():
+        put(None)
+        thread.join()
+        return errors[0] if errors else None
+    
+    thread = threading.Thread(target=writer, daemon=True)
+    thread.start()
+    return put, finish, failed
 
 def video_to_retro_video(input_path, output_path=None, width=None, height=None, 
                           color_depth=16, pixel_size=4, frame_skip=1, fps=None, 
                           add_dialog=False, dialog_text="", output_format='.mp4',
                           aspect_ratio=None, aspect_method='resize',
-                          quality=23, preset='medium'):
-    """Convierte un video a otro video con efecto retro conservando el audio"""
+                          quality=23, preset='medium', workers=None, hwaccel='none', tune=None,
+                          encoder_threads=0):
+    """
+    Convierte un video a otro video con efecto retro conservando el audio
+    
+    Los frames se procesan en un pool de hilos (workers=None usa todos los núcleos);
+    NumPy, OpenCV y PIL liberan el GIL durante el cálculo. La decodificación y la
+    escritura siguen en el hilo principal, en orden.
+    """
     # Verificar que FFmpeg está instalado
     if not check_ffmpeg():
         print("ADVERTENCIA: FFmpeg no está instalado o no se encuentra en el PATH.")
@@ -196,25 +798,31 @@ def video_to_retro_video(input_path, output_path=None, width=None, height=None,
     if not fps:
         fps = original_fps
     
-    # Calcular dimensiones finales considerando el diálogo
+    # Calcular dimensiones finales considerando el diálogo (la franja se dibuja una vez)
     final_height = height
-    if add_dialog:
+    dialog_strip = None
+    if add_dialog and dialog_text:
         final_height += pixel_size * 10
+        dialog_strip = get_dialog_strip(height, width, pixel_size, dialog_text,
+                                        get_font(pixel_size * 3))
     
-    # Determinar el codec basado en el formato de salida
-    _, output_ext = os.path.splitext(output_path)
-    fourcc = cv2.VideoWriter_fourcc(*get_video_codec(output_ext))
-    
-    # Crear un archivo temporal para el video sin audio
-    temp_dir = tempfile.mkdtemp()
-    temp_video = os.path.join(temp_dir, f"temp_video{output_ext}")
-    
-    # Configurar el escritor de video
-    out = cv2.VideoWriter(temp_video if preserve_audio else output_path, 
-                          fourcc, fps, (width, final_height))
-    
-    if not out.isOpened():
-        raise Exception(f"Error al crear el video de salida. Asegúrate de que el codec es compatible con tu sistema.")
+    # Configurar el escritor de video: FFmpeg codifica y añade el audio en una pasada,
+    # sin FFmpeg se usa OpenCV (sin audio)
+    if preserve_audio:
+        encoder = open_encoder(input_path, output_path, width, final_height, fps,
+                               quality, preset, hwaccel, tune, encoder_threads)
+        # tobytes() copia el frame, así su buffer puede reutilizarse mientras se escribe
+        write_chunk, finish_writing, encoder_failed = write_in_background(encoder.stdin)
+        write_frame = lambda retro_frame: write_chunk(retro_frame.tobytes())
+    else:
+        _, output_ext = os.path.splitext(output_path)
+        fourcc = cv2.VideoWriter_fourcc(*get_video_codec(output_ext))
+        out = cv2.VideoWriter(output_path, fourcc, fps, (width, final_height))
+        
+        if not out.isOpened():
+            raise Exception(f"Error al crear el video de salida. Asegúrate de que el codec es compatible con tu sistema.")
+        write_frame = out.write
+        encoder_failed = threading.Event()
     
     print(f"Procesando video ({total_frames} frames)...")
     print(f"  Origen: {os.path.basename(input_path)} ({original_width}x{original_height} a {original_fps:.2f} FPS)")
@@ -222,7 +830,7 @@ def video_to_retro_video(input_path, output_path=None, width=None, height=None,
     print(f"  Configuración: {color_depth} colores, pixelado {pixel_size}, salto de frames {frame_skip}")
     
     if aspect_ratio is not None:
-        print(f"  Relación de aspecto: {aspect_ratio:.2f} (método: {aspect_method})")
+        print(f"  Relación de aspecto: {float(aspect_ratio):.2f} (método: {aspect_method})")
     
     if preserve_audio:
         print(f"  Audio: Se preservará el audio original")
@@ -230,84 +838,172 @@ def video_to_retro_video(input_path, output_path=None, width=None, height=None,
     else:
         print("  Audio: No se preservará (FFmpeg no disponible)")
     
+    def fit_frame(frame):
+        # Aplicar relación de aspecto si se especifica
+        if aspect_ratio is not None:
+            frame = apply_aspect_ratio(frame, aspect_ratio, aspect_method)
+        
+        # Redimensionar si se especifica
+        h, w = frame.shape[:2]
+        if w != width or h != height:
+            downscale = width * height < w * h
+            interpolation = cv2.INTER_AREA if downscale else cv2.INTER_LINEAR
+            frame = cv2.resize(frame, (width, height), interpolation=interpolation)
+        return frame
+    
+    # Calcular la paleta con frames de todo el video y reutilizarla en todos, para
+    # que un inicio oscuro o un fundido no la dejen sin colores (si no se pueden
+    # muestrear, se usa el primer frame)
+    lut = None
+    kernel = None
+    samples = [fit_frame(frame) for frame in sample_frames(cap, total_frames)]
+    if samples:
+        lut = build_palette_lut(samples, color_depth)
+        kernel = make_retro_kernel(lut, height, width, pixel_size, dialog_strip)
+    
+    # Decodificar con FFmpeg si está disponible (en otro proceso y, con hwaccel, en la GPU),
+    # recortando y escalando ya en FFmpeg; OpenCV solo se usa para leer las propiedades del video
+    if preserve_audio:
+        cap.release()
+        video_filter = build_scale_filter(original_width, original_height, width, height,
+                                          aspect_ratio, aspect_method)
+        decoder = open_decoder(input_path, hwaccel, video_filter)
+        frames = read_frames(decoder, width, height)
+    else:
+        frames = capture_frames(cap)
+    
+    def prepare_frame(frame):
+        # Los frames de FFmpeg ya tienen el tamaño final
+        if preserve_audio:
+            return frame
+        return fit_frame(frame)
+    
+    def process_batch(batch, scratch):
+        # Varios frames: preparar el lote en su buffer y procesarlo de una vez
+        if batch_size > 1:
+            frames_in = scratch['in'][:len(batch)]
+            for i, frame in enumerate(batch):
+                frames_in[i] = prepare_frame(frame)
+            return apply_retro_effect_batch(frames_in, lut, pixel_size, scratch['out'][:len(batch)])
+        
+        return [kernel(prepare_frame(batch[0]), scratch)]
+    
     # Procesar frames
     frame_count = 0
     processed_count = 0
     
-    with tqdm(total=total_frames//frame_skip) as pbar:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
+    # Lotes en proceso, en orden de llegada (como máximo uno por worker)
+    max_in_flight = workers or os.cpu_count() or 1
+    pending = deque()
+    
+    def run_inline(fn, *args):
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+    
+    # El kernel de Numba ya reparte cada frame entre los núcleos y su capa de hilos
+    # por defecto solo se puede usar con seguridad desde el hilo principal
+    use_kernel = _retro_kernel is not None and not (add_dialog and dialog_text)
+    if use_kernel:
+        if workers:
+            numba.set_num_threads(min(workers, numba.config.NUMBA_NUM_THREADS))
+        max_in_flight = 1
+    
+    # Sin Numba ni diálogo, los frames pequeños se agrupan en lotes para repartir
+    # el coste de las llamadas de Python (el lote necesita bloques de pixelado completos)
+    batch_size = 1
+    if not use_kernel and not (add_dialog and dialog_text) \
+            and width % pixel_size == 0 and height % pixel_size == 0:
+        batch_size = max(1, min(MAX_BATCH_FRAMES, BATCH_BYTES // (width * height * 3)))
+    
+    # Buffers reservados una sola vez: uno por lote en proceso, usados en rotación.
+    # Cuando se vuelve a usar uno, sus frames anteriores ya se escribieron en la salida
+    if batch_size > 1:
+        scratch_ring = [
+            {
+                'in': np.empty((batch_size, height, width, 3), dtype=np.uint8),
+                'out': np.empty((batch_size, height, width, 3), dtype=np.uint8),
+            }
+            for _ in range(max_in_flight)
+        ]
+    else:
+        scratch_ring = [
+            {
+                'small': np.empty((height // pixel_size, width // pixel_size, 3), dtype=np.uint8),
+                'out': np.empty((final_height, width, 3), dtype=np.uint8),
+            }
+            for _ in range(max_in_flight)
+        ]
+    
+    def write_batch(retro_frames):
+        for retro_frame in retro_frames:
+            write_frame(retro_frame)
+        pbar.update(len(retro_frames))
+        return len(retro_frames)
+    
+    batch = []
+    batch_count = 0
+    
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor, \
+            tqdm(total=total_frames//frame_skip) as pbar:
+        submit = run_inline if use_kernel else executor.submit
+        
+        for frame in frames:
+            # Si el codificador ya falló no tiene sentido seguir decodificando
+            if encoder_failed.is_set():
                 break
             
             # Saltar frames según frame_skip
             if frame_count % frame_skip == 0:
-                # Aplicar relación de aspecto si se especifica
-                if aspect_ratio is not None:
-                    frame = apply_aspect_ratio(frame, aspect_ratio, aspect_method)
-                
-                # Redimensionar si se especifica
-                if frame.shape[1] != width or frame.shape[0] != height:
-                    frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_LANCZOS4)
+                # Sin muestras de todo el video: paleta del primer frame
+                if lut is None:
+                    lut = build_palette_lut(prepare_frame(frame), color_depth)
+                    kernel = make_retro_kernel(lut, height, width, pixel_size, dialog_strip)
                 
-                # Aplicar efecto retro
-                retro_frame = apply_retro_effect(
-                    frame, color_depth, pixel_size, add_dialog, dialog_text
-                )
-                
-                # Escribir frame al video de salida
-                out.write(retro_frame)
-                processed_count += 1
-                pbar.update(1)
+                # Aplicar efecto retro en un worker cuando el lote está completo
+                batch.append(frame)
+                if len(batch) == batch_size:
+                    scratch = scratch_ring[batch_count % max_in_flight]
+                    pending.append(submit(process_batch, batch, scratch))
+                    batch = []
+                    batch_count += 1
+                    
+                    # Escribir al video de salida el lote más antiguo cuando la cola está llena
+                    if len(pending) >= max_in_flight:
+                        processed_count += write_batch(pending.popleft().result())
                 
             frame_count += 1
+        
+        # Procesar el último lote incompleto
+        if batch:
+            scratch = scratch_ring[batch_count % max_in_flight]
+            pending.append(submit(process_batch, batch, scratch))
+        
+        # Escribir los frames que quedan en proceso
+        while pending:
+            processed_count += write_batch(pending.popleft().result())
     
     # Liberar recursos
-    cap.release()
-    out.release()
-    
-    # Si FFmpeg está disponible, combinar video procesado con audio original
     if preserve_audio:
-        print(f"Combinando video procesado con audio original...")
-        
-        # Obtener el codec apropiado para el formato
-        ffmpeg_codec = get_ffmpeg_codec(output_ext)
-        
-        # Comando FFmpeg: usar el audio del original y comprimir el video con la calidad especificada
-        ffmpeg_cmd = [
-            'ffmpeg', '-y',
-            '-i', temp_video,
-            '-i', input_path,
-            '-c:v', ffmpeg_codec,       # Usar codec específico para el formato
-            '-crf', str(quality),       # Factor de calidad constante (menor = mejor calidad)
-            '-preset', preset,          # Preset de codificación (afecta velocidad de compresión y tamaño)
-            '-c:a', 'aac',              # Codec de audio
-            '-b:a', '128k',             # Bitrate de audio
-            '-map', '0:v:0',            # Usar el video del primer input (temp_video)
-            '-map', '1:a:0',            # Usar el audio del segundo input (original)
-            '-shortest',                # Terminar cuando la pista más corta termine
-            output_path
-        ]
-        
+        decoder.stdout.close()
+        decode_error = decoder_error(decoder)
+        write_error = finish_writing()
         try:
-            subprocess.run(ffmpeg_cmd, check=True, 
-                          stdout=subprocess.PIPE, 
-                          stderr=subprocess.PIPE)
-            print(f"Video con audio combinado guardado en: {output_path}")
-        except subprocess.CalledProcessError as e:
-            print(f"Error al combinar video y audio: {e}")
-            print(f"Guardando video sin audio en: {output_path}")
-            # Si falla, usar el video sin audio
-            import shutil
-            shutil.copy(temp_video, output_path)
-    
-    # Limpiar archivos temporales
-    try:
-        if os.path.exists(temp_video):
-            os.remove(temp_video)
-        os.rmdir(temp_dir)
-    except:
-        pass
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+        # El fallo del codificador va primero: al cortar la lectura también falla el decodificador
+        if encoder.wait() != 0:
+            raise Exception(f"Error de FFmpeg al codificar el video: {output_path}") from write_error
+        if write_error is not None:
+            raise write_error
+        if decode_error:
+            # La salida quedó incompleta aunque el codificador terminara bien
+            raise Exception(f"Error de FFmpeg al decodificar el video {input_path}: {decode_error}")
+        print(f"Video guardado en: {output_path}")
+    else:
+        cap.release()
+        out.release()
     
     print(f"Procesados {processed_count} frames de {total_frames} (ratio {frame_skip}:1)")
     return output_path
@@ -316,9 +1012,13 @@ def process_video_directory(input_dir, output_dir=None, width=None, height=None,
                            color_depth=16, pixel_size=4, frame_skip=1, fps=None, 
                            add_dialog=False, dialog_text="", output_format='.mp4',
                            aspect_ratio=None, aspect_method='resize',
-                           quality=23, preset='medium'):
+                           quality=23, preset='medium', workers=None, hwaccel='none',
+                           tune=None, parallel=1):
     """
     Procesa todos los videos en un directorio
+    
+    Con parallel > 1 se convierten varios videos a la vez en procesos separados, y los
+    núcleos se reparten entre ellos (hilos de procesado y del codificador por video).
     """
     # Asegurar que el directorio existe
     input_path = Path(input_dir)
@@ -346,20 +1046,40 @@ def process_video_directory(input_dir, output_dir=None, width=None, height=None,
     
     print(f"Encontrados {len(videos)} videos para procesar")
     
-    # Procesar cada video
-    for i, file_path in enumerate(videos, 1):
-        # Ruta de salida con el formato solicitado
-        output_file = output_path / f"{file_path.stem}_retro-c{color_depth}-p{pixel_size}{output_format}"
-        
-        print(f"\nProcesando video {i}/{len(videos)}: {file_path.name}")
-        
-        # Procesar el video
-        video_to_retro_video(
-            str(file_path), str(output_file), width, height, 
-            color_depth, pixel_size, frame_skip, fps, 
-            add_dialog, dialog_text, output_format,
-            aspect_ratio, aspect_method, quality, preset
+    # Rutas de salida con el formato solicitado
+    output_files = [
+        output_path / f"{file_path.stem}_retro-c{color_depth}-p{pixel_size}{output_format}"
+        for file_path in videos
+    ]
+    
+    if parallel > 1:
+        # Repartir los núcleos entre los videos que se procesan a la vez
+        threads_per_video = max(1, (os.cpu_count() or 1) // parallel)
+        convert = partial(
+            video_to_retro_video,
+            width=width, height=height, color_depth=color_depth, pixel_size=pixel_size,
+            frame_skip=frame_skip, fps=fps, add_dialog=add_dialog, dialog_text=dialog_text,
+            output_format=output_format, aspect_ratio=aspect_ratio, aspect_method=aspect_method,
+            quality=quality, preset=preset, workers=workers or threads_per_video,
+            hwaccel=hwaccel, tune=tune, encoder_threads=threads_per_video
         )
+        
+        print(f"Procesando {parallel} videos a la vez")
+        with ProcessPoolExecutor(max_workers=parallel) as executor:
+            for _ in executor.map(convert, [str(f) for f in videos], [str(f) for f in output_files]):
+                pass
+    else:
+        # Procesar cada video
+        for i, (file_path, output_file) in enumerate(zip(videos, output_files), 1):
+            print(f"\nProcesando video {i}/{len(videos)}: {file_path.name}")
+            
+            # Procesar el video
+            video_to_retro_video(
+                str(file_path), str(output_file), width, height, 
+                color_depth, pixel_size, frame_skip, fps, 
+                add_dialog, dialog_text, output_format,
+                aspect_ratio, aspect_method, quality, preset, workers, hwaccel, tune
+            )
     
     print(f"\nProceso completo: {len(videos)} videos convertidos")
     print(f"Resultados guardados en: {output_path}")
@@ -392,6 +1112,13 @@ if __name__ == '__main__':
     parser_single.add_argument('--preset', choices=['ultrafast', 'superfast', 'veryfast', 'faster', 
                                                    'fast', 'medium', 'slow', 'slower', 'veryslow'], 
                                default='medium', help='Preset de codificación (afecta velocidad/tamaño)')
+    parser_single.add_argument('--workers', type=int, default=None,
+                               help='Número de hilos para procesar frames (default: todos los núcleos)')
+    parser_single.add_argument('--hwaccel', choices=['none', 'nvenc', 'qsv', 'vaapi'], default='none',
+                               help='Codificar H.264 por hardware (NVIDIA, Intel o VAAPI)')
+    parser_single.add_argument('--tune', choices=['film', 'animation', 'grain', 'stillimage',
+                                                   'fastdecode', 'zerolatency'],
+                               help='Ajuste de x264 para el tipo de contenido (solo libx264)')
     
     # Subparser para procesamiento por lotes
     parser_batch = subparsers.add_parser('batch', help='Procesar múltiples videos en un directorio')
@@ -415,6 +1142,15 @@ if __name__ == '__main__':
     parser_batch.add_argument('--preset', choices=['ultrafast', 'superfast', 'veryfast', 'faster', 
                                                  'fast', 'medium', 'slow', 'slower', 'veryslow'], 
                              default='medium', help='Preset de codificación (afecta velocidad/tamaño)')
+    parser_batch.add_argument('--workers', type=int, default=None,
+                             help='Número de hilos para procesar frames (default: todos los núcleos)')
+    parser_batch.add_argument('--hwaccel', choices=['none', 'nvenc', 'qsv', 'vaapi'], default='none',
+                             help='Codificar H.264 por hardware (NVIDIA, Intel o VAAPI)')
+    parser_batch.add_argument('--tune', choices=['film', 'animation', 'grain', 'stillimage',
+                                                 'fastdecode', 'zerolatency'],
+                             help='Ajuste de x264 para el tipo de contenido (solo libx264)')
+    parser_batch.add_argument('--parallel', type=int, default=1,
+                             help='Número de videos a procesar a la vez (default: 1)')
     
     args = parser.parse_args()
     
@@ -430,7 +1166,7 @@ if __name__ == '__main__':
                 args.colors, args.pixel_size, args.frame_skip, args.fps,
                 args.dialog, args.text, args.format,
                 aspect_ratio_value, args.aspect_method,
-                args.quality, args.preset
+                args.quality, args.preset, args.workers, args.hwaccel, args.tune
             )
         elif args.mode == 'batch':
             process_video_directory(
@@ -438,7 +1174,8 @@ if __name__ == '__main__':
                 args.colors, args.pixel_size, args.frame_skip, args.fps,
                 args.dialog, args.text, args.format,
                 aspect_ratio_value, args.aspect_method,
-                args.quality, args.preset
+                args.quality, args.preset, args.workers, args.hwaccel, args.tune,
+                args.parallel
             )
         else:
             parser.print_help()
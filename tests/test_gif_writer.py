@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+import textwrap
+
+import cv2
+import numpy as np
+from PIL import Image, ImageSequence
+
+import pyxelart_gif
+
+# Convierte un video sintético de N frames a GIF en un proceso aparte y muestra
+# el pico de memoria residente (MB) de ese proceso
+MEASURE_SCRIPT = textwrap.dedent("""
+    import resource, sys
+    import cv2, numpy as np
+    import pyxelart_gif
+
+    frames, video_path, gif_path = int(sys.argv[1]), sys.argv[2], sys.argv[3]
+    writer = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*'MJPG'), 30, (320, 240))
+    for i in range(frames):
+        frame = np.full((240, 320, 3), i % 256, dtype=np.uint8)
+        frame[::7] = (i * 37) % 256
+        writer.write(frame)
+    writer.release()
+
+    pyxelart_gif.video_to_retro_gif(video_path, gif_path)
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+""")
+
+
+def test_gif_writer_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (24, 32, 3), dtype=np.uint8) for _ in range(5)]
+    frames = [cv2.resize(f[::8, ::8], (32, 24), interpolation=cv2.INTER_NEAREST) for f in frames]
+
+    path = tmp_path / "out.gif"
+    with pyxelart_gif.GifWriter(str(path), fps=20) as writer:
+        for frame in frames:
+            writer.append_data(frame)
+
+    with Image.open(path) as gif:
+        assert gif.size == (32, 24)
+        assert gif.n_frames == len(frames)
+        assert gif.info['duration'] == 50
+        # Pocos colores por frame: la paleta adaptativa los conserva exactos
+        for frame, decoded in zip(frames, ImageSequence.Iterator(gif)):
+            np.testing.assert_array_equal(np.asarray(decoded.convert('RGB')), frame)
+
+
+def measure_peak_mb(tmp_path, frames):
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE_SCRIPT, str(frames),
+         str(tmp_path / f"in{frames}.avi"), str(tmp_path / f"out{frames}.gif")],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(pyxelart_gif.__file__)),
+    )
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def test_long_clip_memory_is_bounded(tmp_path):
+    # Si los frames se acumularan hasta cerrar el GIF, 360 frames más de
+    # 320x240 sumarían más de 100 MB
+    short_peak = measure_peak_mb(tmp_path, 40)
+    long_peak = measure_peak_mb(tmp_path, 400)
+    assert long_peak - short_peak < 40
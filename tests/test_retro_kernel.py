@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+import pyxelart_video
+
+# Tamaños múltiplos y no múltiplos de pixel_size (bloques incompletos en los bordes)
+SIZES = [
+    (120, 160, 4),
+    (90, 130, 4),
+    (61, 64, 4),
+    (64, 61, 4),
+    (240, 540, 7),
+    (37, 41, 8),
+    (3, 5, 4),
+]
+
+
+@pytest.mark.skipif(pyxelart_video._retro_kernel is None, reason="Numba no está instalado")
+@pytest.mark.parametrize("height,width,pixel_size", SIZES)
+def test_numba_and_opencv_paths_match(monkeypatch, height, width, pixel_size):
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    lut = pyxelart_video.build_palette_lut(frame, 16)
+
+    numba_out = pyxelart_video.make_retro_kernel(lut, height, width, pixel_size)(frame, {})
+    monkeypatch.setattr(pyxelart_video, '_retro_kernel', None)
+    opencv_out = pyxelart_video.make_retro_kernel(lut, height, width, pixel_size)(frame, {})
+
+    np.testing.assert_array_equal(numba_out, opencv_out)
+
+
+@pytest.mark.parametrize("height,width,pixel_size", SIZES)
+def test_blocks_are_uniform(monkeypatch, height, width, pixel_size):
+    # Sin tramado, cada bloque de pixel_size x pixel_size (también los del borde)
+    # tiene un único color
+    monkeypatch.setattr(pyxelart_video, '_retro_kernel', None)
+    monkeypatch.setattr(pyxelart_video, 'get_bayer_tile',
+                        lambda h, w: np.zeros((h, w, 3), dtype=np.uint8))
+    rng = np.random.default_rng(1)
+    frame = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    lut = pyxelart_video.build_palette_lut(frame, 16)
+
+    out = pyxelart_video.make_retro_kernel(lut, height, width, pixel_size)(frame, {})
+    for y in range(0, height, pixel_size):
+        for x in range(0, width, pixel_size):
+            block = out[y:y + pixel_size, x:x + pixel_size].reshape(-1, 3)
+            assert (block == block[0]).all()
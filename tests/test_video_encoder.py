@@ -0,0 +1,30 @@
+import subprocess
+
+import cv2
+import pytest
+
+import pyxelart_video
+
+pytestmark = pytest.mark.skipif(not pyxelart_video.check_ffmpeg(), reason="FFmpeg no está instalado")
+
+
+@pytest.mark.parametrize("size", ["321x241", "320x241", "321x240"])
+def test_odd_dimensions_are_encoded(tmp_path, size):
+    # yuv420p no admite tamaños impares: el codificador debe completarlos a pares
+    input_path = str(tmp_path / "in.mkv")
+    subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi',
+         '-i', f'testsrc=size={size}:rate=10', '-t', '1', '-c:v', 'ffv1', input_path],
+        check=True,
+    )
+    output_path = str(tmp_path / "out.mp4")
+
+    pyxelart_video.video_to_retro_video(input_path, output_path, workers=1)
+
+    cap = cv2.VideoCapture(output_path)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+    expected_width, expected_height = (int(n) for n in size.split('x'))
+    assert (width, height) == (expected_width + expected_width % 2,
+                               expected_height + expected_height % 2)
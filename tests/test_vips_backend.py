@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import pyxelart
+
+pyvips = pytest.importorskip("pyvips")
+
+# Tamaños múltiplos y no múltiplos de pixel_size
+SIZES = [
+    (48, 64, 4),
+    (50, 67, 4),
+    (41, 37, 8),
+    (30, 30, 1),
+]
+
+
+@pytest.fixture
+def no_noise(monkeypatch):
+    # El ruido es aleatorio (uniforme en PIL, gaussiano en libvips): sin él, los
+    # dos backends deben dar exactamente el mismo resultado
+    monkeypatch.setattr(np.random, 'randint', lambda low, high, shape: np.zeros(shape, dtype=np.int64))
+    monkeypatch.setattr(pyvips.Image, 'gaussnoise',
+                        staticmethod(lambda width, height, **kwargs: pyvips.Image.black(width, height)))
+
+
+@pytest.mark.parametrize("mode", ["RGB", "RGBA"])
+@pytest.mark.parametrize("height,width,pixel_size", SIZES)
+def test_vips_matches_pil_backend(tmp_path, no_noise, mode, height, width, pixel_size):
+    rng = np.random.default_rng(0)
+    channels = len(mode)
+    input_path = str(tmp_path / "in.png")
+    Image.fromarray(rng.integers(0, 256, (height, width, channels), dtype=np.uint8), mode).save(input_path)
+
+    results = {}
+    for backend in ('pil', 'vips'):
+        img = pyxelart.retro_effect(input_path, str(tmp_path / f"{backend}.png"),
+                                    color_depth=16, pixel_size=pixel_size,
+                                    palette='fixed', backend=backend)
+        assert img.mode == mode
+        results[backend] = np.asarray(img)
+
+    np.testing.assert_array_equal(results['vips'], results['pil'])
@@ -1,63 +1,291 @@
 #!/usr/bin/env python3
 import argparse
+import json
 import os
-import re
+import shutil
+import string
 import subprocess
+import tempfile
+import threading
+from itertools import count
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+
+# Extensiones de video soportadas en modo directorio
+VIDEO_EXTENSIONS = frozenset({'.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm'})
+
+# Caracteres que se conservan en los nombres de archivo convertidos a snake_case
+_ALNUM = frozenset(string.ascii_letters + string.digits)
+_UPPER = frozenset(string.ascii_uppercase)
+
+# Codificadores por hardware compatibles con WebM (AV1 o VP9), en orden de preferencia
+HW_ENCODERS = {
+    'nvenc': 'av1_nvenc',  # NVIDIA
+    'qsv': 'vp9_qsv',  # Intel Quick Sync / VPL
+    'amf': 'av1_amf',  # AMD
+}
+
+# Decodificación por hardware (método de -hwaccel de ffmpeg) para cada opción de --hwaccel
+HW_DECODERS = {
+    'nvenc': ('cuda',),
+    'qsv': ('qsv', 'vaapi'),
+    'amf': ('d3d11va', 'vaapi'),
+    'auto': ('cuda', 'vaapi', 'qsv'),
+}
+# Códecs de entrada que se decodifican por hardware
+HW_DECODE_CODECS = ('h264', 'hevc')
+# Hilos de ffmpeg por defecto: libvpx-vp9 apenas escala por encima de 8
+MAX_DEFAULT_THREADS = 8
+# Códecs de audio que WebM admite tal cual (se copian sin recodificar)
+WEBM_AUDIO_CODECS = ('opus', 'vorbis')
+
+# Resultados de ffprobe por (ruta, tamaño, mtime); process_directory lo guarda en disco
+_probe_cache = {}
+PROBE_CACHE_FILE = '.probe_cache.json'
+# Registro de las conversiones hechas por process_directory (en el directorio de salida)
+MANIFEST_FILE = '.convert_manifest.json'
+# Codificadores y métodos de decodificación por hardware que fallaron al convertir:
+# el resto de videos del proceso ya no los intenta y va directo a la CPU
+_failed_hardware = set()
 
 
 def snake_case_filename(filename):
     """Convierte un nombre de archivo a snake_case sin extensión"""
-    name = Path(filename).stem
-    # Reemplazar caracteres no alfanuméricos con guiones bajos
-    name = re.sub(r'[^a-zA-Z0-9]', '_', name)
-    # Convertir camelCase o PascalCase a snake_case
-    name = re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
-    # Eliminar guiones bajos múltiples
-    name = re.sub(r'_+', '_', name)
-    # Eliminar guiones bajos al inicio o final
-    name = name.strip('_')
-    return name
+    chars = []
+    for char in Path(filename).stem:
+        if char in _ALNUM:
+            # Convertir camelCase o PascalCase a snake_case
+            if char in _UPPER and chars and chars[-1] != '_':
+                chars.append('_')
+            chars.append(char.lower())
+        elif chars and chars[-1] != '_':
+            # Reemplazar caracteres no alfanuméricos con un guion bajo (sin repetirlos
+            # ni dejarlos al inicio)
+            chars.append('_')
+    # Eliminar el guion bajo final
+    return ''.join(chars).rstrip('_')
+
+
+@lru_cache(maxsize=None)
+def get_ffmpeg_encoders():
+    """Devuelve los nombres de los codificadores disponibles en ffmpeg (se consulta una vez)"""
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-encoders'],
+                                capture_output=True, text=True)
+    except FileNotFoundError:
+        return frozenset()
+
+    # Las líneas de codificadores tienen la forma " V..... nombre  descripción"
+    encoders = set()
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'VAS':
+            encoders.add(parts[1])
+    return frozenset(encoders)
+
+
+@lru_cache(maxsize=None)
+def get_ffmpeg_hwaccels():
+    """Devuelve los métodos de decodificación por hardware de ffmpeg (se consulta una vez)"""
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-hwaccels'],
+                                capture_output=True, text=True)
+    except FileNotFoundError:
+        return frozenset()
+
+    # La primera línea es el título "Hardware acceleration methods:"
+    return frozenset(line.strip() for line in result.stdout.splitlines()[1:] if line.strip())
+
+
+@lru_cache(maxsize=None)
+def hw_encoder_works(encoder):
+    """
+    Comprueba (una vez) que un codificador por hardware funciona en este equipo
+
+    ffmpeg -encoders solo indica con qué se compiló ffmpeg, no si hay una GPU que
+    lo soporte: se codifica un frame de prueba y se descarta la salida.
+    """
+    pix_fmt = 'nv12' if encoder.endswith('_qsv') else 'yuv420p'
+    cmd = ['ffmpeg', '-hide_banner', '-v', 'error',
+           '-f', 'lavfi', '-i', 'color=black:s=256x256:r=1', '-frames:v', '1',
+           '-c:v', encoder, '-pix_fmt', pix_fmt, '-f', 'null', '-']
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+@lru_cache(maxsize=None)
+def hw_decoder_works(method):
+    """
+    Comprueba (una vez) que un método de decodificación por hardware funciona
+
+    Igual que con los codificadores, ffmpeg -hwaccels no indica si hay dispositivo:
+    se abre el dispositivo del método, que es lo que falla sin la GPU.
+    """
+    cmd = ['ffmpeg', '-hide_banner', '-v', 'error', '-init_hw_device', method,
+           '-f', 'lavfi', '-i', 'nullsrc=s=64x64', '-frames:v', '1', '-f', 'null', '-']
+    try:
+        return subprocess.run(cmd, capture_output=True, timeout=30).returncode == 0
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+
+
+def hw_encoder_usable(encoder):
+    """Indica si el codificador está en ffmpeg, funciona y no ha fallado antes"""
+    return (encoder in get_ffmpeg_encoders() and encoder not in _failed_hardware
+            and hw_encoder_works(encoder))
+
+
+def detect_hw_encoder():
+    """Devuelve el primer tipo de codificador por hardware disponible ('nvenc', 'qsv', 'amf') o None"""
+    for hw, encoder in HW_ENCODERS.items():
+        if hw_encoder_usable(encoder):
+            return hw
+    return None
+
+
+def get_video_encoder(hwaccel='none'):
+    """
+    Elige el codificador de video según la opción de hardware
+
+    Args:
+        hwaccel: 'none', 'auto' (el primero disponible) o 'nvenc', 'qsv', 'amf'
+
+    Returns:
+        str: Nombre del codificador de ffmpeg (libvpx-vp9 si no hay uno por hardware)
+    """
+    if hwaccel == 'auto':
+        hwaccel = detect_hw_encoder()
+    if hwaccel in HW_ENCODERS and hw_encoder_usable(HW_ENCODERS[hwaccel]):
+        return HW_ENCODERS[hwaccel]
+    if hwaccel not in (None, 'none'):
+        print(f"Advertencia: el codificador {HW_ENCODERS[hwaccel]} no está disponible "
+              f"en este equipo, se usará libvpx-vp9")
+    return 'libvpx-vp9'
+
+
+def _probe_cache_key(video_path):
+    """Clave del caché de ffprobe: cambia si el archivo se modifica o se reemplaza"""
+    try:
+        st = os.stat(video_path)
+    except OSError:
+        return None
+    return f"{os.path.realpath(video_path)}|{st.st_size}|{int(st.st_mtime)}"
+
+
+def load_probe_cache(cache_path):
+    """Carga en memoria el caché de ffprobe guardado en disco (si existe)"""
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            _probe_cache.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+
+
+def save_probe_cache(cache_path):
+    """Guarda en disco el caché de ffprobe"""
+    try:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump(_probe_cache, f)
+    except OSError as e:
+        print(f"Advertencia: no se pudo guardar el caché de ffprobe: {e}")
+
+
+def load_manifest(manifest_path):
+    """Carga el registro de conversiones anteriores: ruta del original (relativa a la entrada) -> datos"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(manifest_path, manifest):
+    """Guarda en disco el registro de conversiones (escribe una copia y la reemplaza)"""
+    try:
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, manifest_path)
+    except OSError as e:
+        print(f"Advertencia: no se pudo guardar el registro de conversiones: {e}")
+
+
+def get_available_cpus():
+    """Devuelve los núcleos en los que puede ejecutarse el proceso, ordenados"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def get_hw_decoder(codec_name, hwaccel='none'):
+    """
+    Elige el método de decodificación por hardware para el códec de entrada
+
+    Args:
+        codec_name: Códec del video de entrada (según ffprobe)
+        hwaccel: 'none', 'auto' o 'nvenc', 'qsv', 'amf'
+
+    Returns:
+        str: Método para -hwaccel de ffmpeg, o None para decodificar por CPU
+    """
+    if codec_name not in HW_DECODE_CODECS:
+        return None
+    available = get_ffmpeg_hwaccels()
+    for method in HW_DECODERS.get(hwaccel, ()):
+        if method in available and method not in _failed_hardware and hw_decoder_works(method):
+            return method
+    return None
 
 
 def get_video_info(video_path):
-    """Obtiene información del video usando ffprobe"""
+    """Obtiene información del video usando ffprobe (o el caché si el archivo no cambió)"""
+    cache_key = _probe_cache_key(video_path)
+    if cache_key in _probe_cache:
+        return dict(_probe_cache[cache_key])
+
     try:
-        # Obtener dimensiones del video
+        # Una sola llamada a ffprobe para todos los streams (video y audio)
         cmd = [
-            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
-            '-show_entries', 'stream=width,height,duration',
-            '-of', 'csv=p=0', video_path
+            'ffprobe', '-v', 'error', '-threads', '0',
+            '-show_entries', 'stream=index,codec_type,codec_name,width,height,duration',
+            '-of', 'json', video_path
         ]
         result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        width, height, duration = result.stdout.strip().split(',')
-
-        # Verificar si tiene audio
-        cmd_audio = [
-            'ffprobe', '-v', 'error', '-select_streams', 'a',
-            '-show_entries', 'stream=codec_type', '-of', 'csv=p=0',
-            video_path
-        ]
-        has_audio = len(subprocess.run(cmd_audio, capture_output=True,
-                                       text=True).stdout.strip()) > 0
-
-        return {
-            'width': int(width),
-            'height': int(height),
-            'duration': float(duration) if duration else None,
-            'has_audio': has_audio
+        streams = json.loads(result.stdout).get('streams', [])
+
+        video = next(s for s in streams if s.get('codec_type') == 'video')
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+        duration = video.get('duration')
+
+        info = {
+            'width': int(video['width']),
+            'height': int(video['height']),
+            'duration': float(duration) if duration not in (None, 'N/A') else None,
+            'has_audio': audio is not None,
+            'video_codec': video.get('codec_name'),
+            'audio_codec': audio.get('codec_name') if audio else None
         }
+        if cache_key:
+            _probe_cache[cache_key] = info
+        return dict(info)
     except subprocess.CalledProcessError as e:
         print(f"Error al obtener información del video: {e}")
         return None
-    except ValueError as e:
+    except StopIteration:
+        print(f"Error: '{video_path}' no tiene stream de video")
+        return None
+    except (ValueError, KeyError) as e:
         print(f"Error al procesar información del video: {e}")
         return None
 
 
 def convert_to_webm(input_video, output_path=None, quality=30,
-                    resize=None, crop=None, threads=None, verbose=False):
+                    resize=None, crop=None, threads=None, verbose=False, hwaccel='none',
+                    two_pass=False, precomputed_info=None):
     """
     Convierte un video al formato WebM
 
@@ -67,12 +295,17 @@ def convert_to_webm(input_video, output_path=None, quality=30,
         quality: Calidad del video (0-100), donde 0 es la peor y 100 la mejor
         resize: Tuple (width, height) para redimensionar el video
         crop: Tuple (x, y, width, height) para recortar el video
-        threads: Número de hilos para la codificación
+        threads: Número de hilos para la codificación (por defecto: núcleos disponibles, máximo 8)
         verbose: Mostrar información detallada
+        hwaccel: Codificación y decodificación por hardware ('none', 'auto', 'nvenc', 'qsv', 'amf');
+            si falla, se vuelve a convertir por CPU con libvpx-vp9
+        two_pass: Codificar VP9 en dos pasadas (mejor ajuste al bitrate, archivos más pequeños)
+        precomputed_info: Resultado de get_video_info si ya se consultó (evita otro ffprobe)
 
     Returns:
         bool: True si la conversión fue exitosa, False en caso contrario
     """
+    passlog_dir = None
     try:
         # Verificar si el video existe
         if not os.path.exists(input_video):
@@ -80,7 +313,7 @@ def convert_to_webm(input_video, output_path=None, quality=30,
             return False
 
         # Obtener información del video
-        video_info = get_video_info(input_video)
+        video_info = precomputed_info or get_video_info(input_video)
         if not video_info:
             return False
 
@@ -111,6 +344,13 @@ def convert_to_webm(input_video, output_path=None, quality=30,
         if not verbose:
             cmd.extend(['-v', 'warning'])
 
+        # Decodificar por hardware (H.264/HEVC). Sin -hwaccel_output_format ffmpeg
+        # copia los frames a memoria, así que los filtros de recorte y escala siguen
+        # funcionando sobre la CPU
+        hw_decoder = get_hw_decoder(video_info.get('video_codec'), hwaccel)
+        if hw_decoder:
+            cmd.extend(['-hwaccel', hw_decoder])
+
         cmd.extend(['-i', input_video])
 
         # Aplicar filtros si es necesario
@@ -131,20 +371,76 @@ def convert_to_webm(input_video, output_path=None, quality=30,
             cmd.extend(['-vf', ','.join(filter_complex)])
 
         # Configuración de codificación
-        cmd.extend([
-            '-c:v', 'libvpx-vp9',  # Codec VP9
-            '-b:v', f'{bitrate}k',  # Bitrate
-            '-deadline', 'good',  # Balance entre velocidad y calidad
-            '-cpu-used', '4',  # Mayor valor = más rápido, menor calidad
-            '-pix_fmt', 'yuv420p'  # Formato de pixel estándar para evitar advertencias
-        ])
+        video_encoder = get_video_encoder(hwaccel)
+        uses_hardware = hw_decoder is not None or video_encoder != 'libvpx-vp9'
+        if video_encoder == 'av1_nvenc':
+            cmd.extend([
+                '-c:v', 'av1_nvenc',  # AV1 en la GPU NVIDIA
+                '-b:v', f'{bitrate}k',  # Bitrate
+                '-preset', 'p4',  # Balance entre velocidad y calidad
+                '-rc', 'vbr',
+                '-pix_fmt', 'yuv420p'
+            ])
+        elif video_encoder == 'vp9_qsv':
+            cmd.extend([
+                '-c:v', 'vp9_qsv',  # VP9 en Intel Quick Sync
+                '-b:v', f'{bitrate}k',  # Bitrate
+                '-pix_fmt', 'nv12'  # Formato de pixel que admite QSV
+            ])
+        elif video_encoder == 'av1_amf':
+            cmd.extend([
+                '-c:v', 'av1_amf',  # AV1 en la GPU AMD
+                '-b:v', f'{bitrate}k',  # Bitrate
+                '-usage', 'transcoding',
+                '-quality', 'balanced',  # Balance entre velocidad y calidad
+                '-pix_fmt', 'yuv420p'
+            ])
+        else:
+            cmd.extend([
+                '-c:v', 'libvpx-vp9',  # Codec VP9
+                '-b:v', f'{bitrate}k',  # Bitrate
+                '-deadline', 'good',  # Balance entre velocidad y calidad
+                '-cpu-used', '4',  # Mayor valor = más rápido, menor calidad
+                '-row-mt', '1',  # Multihilo por filas dentro de cada tile
+                '-tile-columns', '2',  # 4 columnas de tiles (log2) que se codifican en paralelo
+                '-tile-rows', '0',
+                '-auto-alt-ref', '1',  # Frames de referencia alternativos
+                '-lag-in-frames', '25',  # Frames que el codificador puede mirar por adelantado
+                '-pix_fmt', 'yuv420p'  # Formato de pixel estándar para evitar advertencias
+            ])
 
         # Configurar número de hilos
-        if threads:
-            cmd.extend(['-threads', str(threads)])
+        if not threads:
+            threads = min(len(get_available_cpus()), MAX_DEFAULT_THREADS)
+        cmd.extend(['-threads', str(threads)])
+
+        # Dos pasadas (solo VP9 por CPU): la primera, sin audio y sin salida, solo analiza
+        # el video y guarda las estadísticas que usa la segunda para repartir el bitrate
+        if two_pass and video_encoder == 'libvpx-vp9':
+            passlog_dir = tempfile.mkdtemp()
+            passlogfile = os.path.join(passlog_dir, 'vp9')
+
+            first_pass = cmd + ['-pass', '1', '-passlogfile', passlogfile,
+                                '-an', '-f', 'null', '-']
+            print(f"Analizando (primera pasada): {os.path.basename(input_video)}")
+            if verbose:
+                print(f"Comando: {' '.join(first_pass)}")
+            process = subprocess.run(first_pass, capture_output=not verbose, text=True)
+            if process.returncode != 0 and uses_hardware:
+                print(f"Advertencia: falló la decodificación por hardware ({hw_decoder}), se usará la CPU")
+                _failed_hardware.update({hw_decoder, video_encoder} - {None, 'libvpx-vp9'})
+                return convert_to_webm(input_video, output_path, quality, resize, crop,
+                                       threads, verbose, hwaccel='none', two_pass=two_pass,
+                                       precomputed_info=video_info)
+            process.check_returncode()
+
+            cmd.extend(['-pass', '2', '-passlogfile', passlogfile])
 
         # Configuración de audio
-        if video_info['has_audio']:
+        if video_info.get('audio_codec') in WEBM_AUDIO_CODECS:
+            # El audio ya es compatible con WebM: copiarlo sin recodificar
+            cmd.extend(['-c:a', 'copy'])
+        elif video_info['has_audio']:
             cmd.extend([
                 '-c:a', 'libopus',  # Codec Opus para audio
                 '-b:a', '96k'  # Bitrate de audio reducido
@@ -162,6 +458,14 @@ def convert_to_webm(input_video, output_path=None, quality=30,
         process = subprocess.run(cmd,
                                  capture_output=not verbose,
                                  text=True)
+
+        # Si el hardware falla (p. ej. la GPU no soporta el códec), convertir por CPU con libvpx-vp9
+        if process.returncode != 0 and uses_hardware:
+            print(f"Advertencia: falló {hw_decoder or video_encoder}, se usará la CPU con libvpx-vp9")
+            _failed_hardware.update({hw_decoder, video_encoder} - {None, 'libvpx-vp9'})
+            return convert_to_webm(input_video, output_path, quality, resize, crop,
+                                   threads, verbose, hwaccel='none', two_pass=two_pass,
+                                   precomputed_info=video_info)
         process.check_returncode()
 
         # Verificar tamaños para comparación
@@ -182,10 +486,48 @@ def convert_to_webm(input_video, output_path=None, quality=30,
     except Exception as e:
         print(f"Error inesperado: {e}")
         return False
+    finally:
+        # Eliminar el registro de la primera pasada
+        if passlog_dir:
+            shutil.rmtree(passlog_dir, ignore_errors=True)
+
+
+def _iter_videos(root, recursive=False, skip_dir=None):
+    """
+    Genera las entradas (os.DirEntry) de los videos de un directorio
+
+    Args:
+        root: Directorio donde buscar
+        recursive: Buscar también en subdirectorios
+        skip_dir: Directorio que no se recorre (p. ej. el de salida)
+    """
+    skip_dir = os.path.realpath(skip_dir) if skip_dir else None
+    stack = [root]
+    while stack:
+        # Los directorios o archivos que no se pueden leer (permisos, enlaces rotos,
+        # borrados durante el recorrido) se saltan sin detener la búsqueda
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive and os.path.realpath(entry.path) != skip_dir:
+                            stack.append(entry.path)
+                        continue
+                    is_video = (entry.is_file()
+                                and os.path.splitext(entry.name)[1].lower() in VIDEO_EXTENSIONS)
+                except OSError:
+                    continue
+                if is_video:
+                    yield entry
 
 
 def process_directory(input_dir, output_dir=None, quality=30, resize=None,
-                      crop=None, recursive=False, max_workers=1, verbose=False):
+                      crop=None, recursive=False, max_workers=1, verbose=False,
+                      hwaccel='none', two_pass=False):
     """
     Procesa todos los videos en un directorio
 
@@ -198,6 +540,8 @@ def process_directory(input_dir, output_dir=None, quality=30, resize=None,
         recursive: Buscar videos en subdirectorios
         max_workers: Número máximo de trabajos en paralelo (default: 1)
         verbose: Mostrar información detallada
+        hwaccel: Codificador por hardware ('none', 'auto', 'nvenc', 'qsv', 'amf')
+        two_pass: Codificar VP9 en dos pasadas
 
     Returns:
         dict: Estadísticas del proceso
@@ -214,22 +558,17 @@ def process_directory(input_dir, output_dir=None, quality=30, resize=None,
     # Crear directorio de salida si no existe
     os.makedirs(output_dir, exist_ok=True)
 
-    # Extensiones de video soportadas
-    video_extensions = ('.mp4', '.avi', '.mov', '.mkv', '.flv', '.wmv', '.webm')
-
-    # Encontrar todos los videos
-    videos = []
-
-    if recursive:
-        # Buscar en subdirectorios
-        for root, _, files in os.walk(input_dir):
-            for file in files:
-                if file.lower().endswith(video_extensions):
-                    videos.append(os.path.join(root, file))
-    else:
-        # Buscar solo en el directorio principal
-        videos = [os.path.join(input_dir, f) for f in os.listdir(input_dir)
-                  if f.lower().endswith(video_extensions)]
+    # Encontrar todos los videos (sin entrar en el directorio de salida, que puede
+    # estar dentro del de entrada y ya contiene archivos .webm)
+    # La fecha de modificación de cada original sale del mismo recorrido
+    # (DirEntry guarda el resultado de stat)
+    source_mtimes = {}
+    for entry in _iter_videos(input_dir, recursive, skip_dir=output_dir):
+        try:
+            source_mtimes[entry.path] = entry.stat().st_mtime
+        except OSError:
+            continue
+    videos = list(source_mtimes)
 
     if not videos:
         print(f"No se encontraron videos en '{input_dir}'")
@@ -237,27 +576,117 @@ def process_directory(input_dir, output_dir=None, quality=30, resize=None,
 
     print(f"Encontrados {len(videos)} videos para procesar")
 
-    # Función para procesar un video individual
-    def process_video(video_path):
-        rel_path = os.path.relpath(video_path, input_dir)
-        output_subdir = os.path.dirname(rel_path)
+    # Reutilizar la información de ffprobe de ejecuciones anteriores
+    probe_cache_path = os.path.join(output_dir, PROBE_CACHE_FILE)
+    load_probe_cache(probe_cache_path)
 
-        # Crear subdirectorio en la salida si es necesario
-        full_output_dir = os.path.join(output_dir, output_subdir)
-        os.makedirs(full_output_dir, exist_ok=True)
+    rel_paths = {video: os.path.relpath(video, input_dir) for video in videos}
 
-        output_file = os.path.join(
-            full_output_dir,
+    def get_output_file(video_path):
+        rel_path = rel_paths[video_path]
+        return os.path.join(
+            output_dir,
+            os.path.dirname(rel_path),
             f"{snake_case_filename(os.path.basename(video_path))}.webm"
         )
 
-        # Comprobar si el archivo ya existe y es más reciente que el original
-        if os.path.exists(output_file):
-            input_time = os.path.getmtime(video_path)
-            output_time = os.path.getmtime(output_file)
-            if output_time >= input_time:
-                print(f"Omitiendo {os.path.basename(video_path)} - ya procesado")
-                return True
+    # Registro de conversiones anteriores, por ruta relativa a la entrada. Las
+    # salidas se buscan en un único listado (scandir) por directorio de salida:
+    # si no aparecen, el video está pendiente sin más consultas; si el original
+    # no cambió desde que se convirtió, basta con que la salida conserve el
+    # tamaño y la fecha registrados
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = load_manifest(manifest_path)
+    manifest_lock = threading.Lock()
+    output_listings = {}
+
+    def list_outputs(directory):
+        if directory not in output_listings:
+            try:
+                with os.scandir(directory) as entries:
+                    output_listings[directory] = {entry.name: entry for entry in entries}
+            except OSError:
+                output_listings[directory] = {}
+        return output_listings[directory]
+
+    def record_conversion(video_path, output_file, ok, output_stat=None, save=True):
+        entry = {'src_mtime': source_mtimes[video_path], 'ok': ok}
+        if ok:
+            st = output_stat or os.stat(output_file)
+            entry.update(dst_mtime=st.st_mtime, dst_size=st.st_size)
+        with manifest_lock:
+            manifest[rel_paths[video_path]] = entry
+            # Guardar tras cada conversión: si el proceso se interrumpe no se
+            # pierde lo ya convertido
+            if save:
+                save_manifest(manifest_path, manifest)
+
+    def is_processed(video_path, output_file):
+        directory, name = os.path.split(output_file)
+        output_entry = list_outputs(directory).get(name)
+        if output_entry is None:
+            return False
+
+        src_mtime = source_mtimes[video_path]
+        entry = manifest.get(rel_paths[video_path])
+        try:
+            st = output_entry.stat()
+        except OSError:
+            return False
+        if entry and entry.get('src_mtime') == src_mtime:
+            # Una salida que falló o que cambió después se vuelve a convertir
+            return (entry.get('ok', False) and entry.get('dst_size') == st.st_size
+                    and entry.get('dst_mtime') == st.st_mtime)
+
+        # Sin registro: el archivo ya existe y es más reciente que el original
+        if st.st_mtime >= src_mtime:
+            record_conversion(video_path, output_file, True, st, save=False)
+            return True
+        return False
+
+    # Separar los videos ya procesados antes de empezar (se omiten sin consultar ffprobe)
+    output_files = {video: get_output_file(video) for video in videos}
+    pending = [video for video in videos if not is_processed(video, output_files[video])]
+    skipped = len(videos) - len(pending)
+    if skipped:
+        print(f"Omitiendo {skipped} videos ya procesados")
+        save_manifest(manifest_path, manifest)
+
+    # Consultar ffprobe en paralelo para todos los videos pendientes antes de
+    # empezar a convertir (ffprobe apenas usa CPU, así que basta con hilos)
+    video_infos = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(32, len(pending))) as executor:
+            video_infos = dict(zip(pending, executor.map(get_video_info, pending)))
+
+    # Cada trabajo en paralelo usa su propio grupo de núcleos: ffmpeg recibe
+    # -threads con el tamaño del grupo y el hilo que lo lanza queda fijado a esos
+    # núcleos (los procesos hijos heredan la afinidad), así las instancias de
+    # ffmpeg no compiten por los mismos núcleos
+    cpus = get_available_cpus()
+    workers = max(1, min(max_workers, len(cpus)))
+    cores_per_worker = max(1, len(cpus) // workers)
+    # Más allá de este límite libvpx apenas escala, igual que sin --workers
+    threads_per_worker = min(cores_per_worker, MAX_DEFAULT_THREADS)
+    worker_ids = count()
+
+    def pin_worker():
+        worker_id = next(worker_ids)
+        cores = cpus[worker_id * cores_per_worker:(worker_id + 1) * cores_per_worker]
+        if cores and hasattr(os, 'sched_setaffinity'):
+            # En Linux el pid 0 se refiere solo al hilo actual
+            os.sched_setaffinity(0, cores)
+
+    # Función para procesar un video individual
+    def process_video(video_path):
+        output_file = output_files[video_path]
+
+        # ffprobe ya falló para este video (el error se mostró al consultarlo)
+        if video_infos.get(video_path) is None:
+            return False
+
+        # Crear subdirectorio en la salida si es necesario
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
 
         # Convertir video
         success = convert_to_webm(
@@ -266,24 +695,35 @@ def process_directory(input_dir, output_dir=None, quality=30, resize=None,
             quality,
             resize,
             crop,
-            threads=1,  # Un solo hilo por worker
-            verbose=verbose
+            threads=threads_per_worker,  # Los núcleos asignados a este worker
+            verbose=verbose,
+            hwaccel=hwaccel,
+            two_pass=two_pass,
+            precomputed_info=video_infos[video_path]
         )
 
+        record_conversion(video_path, output_file, success)
         return success
 
     # Procesar videos secuencialmente o en paralelo
-    results = []
-    if max_workers <= 1:
-        # Procesamiento secuencial
-        for video in videos:
-            results.append(process_video(video))
-    else:
-        # Procesamiento en paralelo (limitado)
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            futures = [executor.submit(process_video, video) for video in videos]
-            for future in futures:
-                results.append(future.result())
+    results = [True] * skipped
+    try:
+        if workers <= 1:
+            # Procesamiento secuencial
+            for video in pending:
+                results.append(process_video(video))
+        else:
+            # Procesamiento en paralelo (limitado). Los hilos solo esperan a ffmpeg,
+            # que hace el trabajo en su propio proceso
+            with ThreadPoolExecutor(max_workers=workers, initializer=pin_worker) as executor:
+                futures = [executor.submit(process_video, video) for video in pending]
+                for future in futures:
+                    results.append(future.result())
+    finally:
+        # También si se interrumpe (Ctrl+C) o falla a mitad del lote
+        save_probe_cache(probe_cache_path)
+        with manifest_lock:
+            save_manifest(manifest_path, manifest)
 
     # Estadísticas
     stats = {
@@ -328,6 +768,10 @@ def main():
                        help='Recortar video (formato: x:y:width:height)')
         p.add_argument('--verbose', '-v', action='store_true',
                        help='Mostrar información detallada')
+        p.add_argument('--hwaccel', choices=['none', 'auto', 'nvenc', 'qsv', 'amf'], default='none',
+                       help='Codificar por hardware: AV1 (nvenc, amf) o VP9 (qsv); también decodifica H.264/HEVC por hardware (default: none)')
+        p.add_argument('--two-pass', action='store_true',
+                       help='Codificar VP9 en dos pasadas (archivos más pequeños a igual calidad)')
 
     args = parser.parse_args()
 
@@ -378,7 +822,9 @@ def main():
             args.quality,
             resize,
             crop,
-            verbose=args.verbose
+            verbose=args.verbose,
+            hwaccel=args.hwaccel,
+            two_pass=args.two_pass
         )
 
     # Ejecutar en modo directorio
@@ -395,7 +841,9 @@ def main():
             crop,
             args.recursive,
             args.workers,
-            args.verbose
+            args.verbose,
+            args.hwaccel,
+            args.two_pass
         )
 
 